@@ -1,163 +1,4734 @@
 import os
+import queue
+from collections import Counter
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify, make_response
+from jinja2 import FileSystemBytecodeCache
+from flask_wtf.csrf import CSRFError
+from werkzeug.middleware.proxy_fix import ProxyFix
+from forms import ContactForm, ServiceInquiryForm
+from page_cache import PageCache
+from streaming import TemplateStreamer
+from partials import PartialNavigation
+from prefetch import PrefetchPolicy
+from fragment_cache import FragmentCache
+from inquiry_store import InquiryQueue
+from notifications import Notifier
+from lead_routing import LeadRouter
+from admin import InquiryAdmin
+from log_pipeline import configure_logging
+from compression import Compress
+from conditional import ConditionalGet
+from assets import AssetManifest
+from vendor_assets import VendorAssets
+from catalog import catalog
+from spec_search import SpecIndex
+from ratelimit import RateLimiter
+from spam_filter import SpamFilter
+from metrics import Metrics
+from csrf_tokens import DoubleSubmitCSRF
+from form_rules import FormRules
+
+# Configure logging (set LOG_LEVEL=WARNING in production, LOG_ASYNC=0 to write synchronously)
+configure_logging(level=os.environ.get("LOG_LEVEL", "DEBUG"),
+                  use_queue=os.environ.get("LOG_ASYNC", "1") == "1")
+
+app = Flask(__name__)
+app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+
+# Trust X-Forwarded-For/-Proto from this many reverse proxies (0 = connect directly)
+trusted_proxies = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+if trusted_proxies:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies)
+
+# Template reloading follows debug mode unless TEMPLATES_AUTO_RELOAD is set explicitly
+if os.environ.get("TEMPLATES_AUTO_RELOAD") is not None:
+    app.config['TEMPLATES_AUTO_RELOAD'] = os.environ["TEMPLATES_AUTO_RELOAD"] == "1"
+
+# Share compiled template bytecode between workers and across restarts
+template_cache_dir = os.environ.get("TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, 'jinja_cache'))
+os.makedirs(template_cache_dir, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
+
+# Per-endpoint request metrics on /metrics; registered first so the timing covers every other hook
+app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "1") == "1"
+app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN") or None
+metrics = Metrics(app)
+
+# Memoise the static layout fragments of base.html ({% cache %} tags)
+app.config['FRAGMENT_CACHE_ENABLED'] = os.environ.get("FRAGMENT_CACHE_ENABLED", "1") == "1"
+fragment_cache = FragmentCache(app)
+
+# Initialize CSRF protection ('stateless' signs tokens against a cookie so form pages can be cached)
+app.config['CSRF_MODE'] = os.environ.get("CSRF_MODE", "session")
+csrf = DoubleSubmitCSRF(app)
+
+# Serve the form-free pages from pre-rendered snapshots
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+page_cache = PageCache(app)
+
+# Stream the long pages when they are rendered live (page cache off, or flashes pending)
+app.config['STREAM_TEMPLATES'] = os.environ.get("STREAM_TEMPLATES", "0") == "1"
+streamer = TemplateStreamer(app)
+
+# Render only the content block for main.js in-place navigations (X-Partial: content)
+app.config['PARTIAL_NAVIGATION'] = os.environ.get("PARTIAL_NAVIGATION", "1") == "1"
+partial_navigation = PartialNavigation(app)
+
+# Answer link prefetches from the page cache; decline live renders while busy
+app.config['PREFETCH_ENABLED'] = os.environ.get("PREFETCH_ENABLED", "1") == "1"
+app.config['PREFETCH_BUSY_THRESHOLD'] = int(os.environ.get("PREFETCH_BUSY_THRESHOLD", "2"))
+prefetch = PrefetchPolicy(app)
+
+# Compress responses; static files are served from precompressed siblings
+app.config['COMPRESS_ENABLED'] = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+compress = Compress(app)
+
+# ETags and 304s for rendered pages; created after Compress so it runs first
+app.config['CONDITIONAL_GET_ENABLED'] = os.environ.get("CONDITIONAL_GET_ENABLED", "1") == "1"
+conditional_get = ConditionalGet(app)
+
+# Fingerprint static URLs so browsers can cache assets for a year
+app.config['ASSET_FINGERPRINT'] = os.environ.get("ASSET_FINGERPRINT", "1") == "1"
+assets = AssetManifest(app)
+
+# Self-host trimmed Bootstrap/Font Awesome once 'flask vendor-assets' has been run
+app.config['VENDOR_ASSETS'] = os.environ.get("VENDOR_ASSETS", "cdn")
+app.config['VENDOR_EXTRA_CLASSES'] = [category.icon for category in catalog.categories]
+vendor_assets = VendorAssets(app)
+
+# Persist form submissions from a background writer thread
+app.config['INQUIRY_DB_PATH'] = os.environ.get("INQUIRY_DB_PATH", os.path.join(app.instance_path, 'inquiries.db'))
+inquiry_queue = InquiryQueue(app)
+
+# Assign each inquiry to a team queue (rules file from LEAD_ROUTING_RULES, built-in defaults otherwise)
+app.config['LEAD_ROUTING_RULES'] = os.environ.get("LEAD_ROUTING_RULES") or None
+lead_router = LeadRouter(app)
+
+# Inquiry dashboard at /admin/inquiries (404 until ADMIN_PASSWORD_HASH is set; see 'flask admin-password')
+app.config['ADMIN_USERNAME'] = os.environ.get("ADMIN_USERNAME", "admin")
+app.config['ADMIN_PASSWORD_HASH'] = os.environ.get("ADMIN_PASSWORD_HASH") or None
+inquiry_admin = InquiryAdmin(app, service_types=ServiceInquiryForm.service_type.kwargs['choices'])
+
+# Email the team about committed inquiries from a background outbox (needs MAIL_SERVER)
+app.config['MAIL_SERVER'] = os.environ.get("MAIL_SERVER") or None
+app.config['MAIL_PORT'] = int(os.environ.get("MAIL_PORT", "25"))
+app.config['MAIL_USE_TLS'] = os.environ.get("MAIL_USE_TLS", "0") == "1"
+app.config['MAIL_USERNAME'] = os.environ.get("MAIL_USERNAME") or None
+app.config['MAIL_PASSWORD'] = os.environ.get("MAIL_PASSWORD") or None
+app.config['MAIL_SENDER'] = os.environ.get("MAIL_SENDER", "website@civilstructuretest.tech")
+app.config['NOTIFY_RECIPIENTS'] = [a.strip() for a in os.environ.get("NOTIFY_RECIPIENTS", "").split(",") if a.strip()]
+# e.g. NOTIFY_TEAM_RECIPIENTS="ndt=ndt@example.com;rentals=fleet@example.com,ops@example.com"
+app.config['NOTIFY_TEAM_RECIPIENTS'] = {
+    team.strip(): [a.strip() for a in addresses.split(",") if a.strip()]
+    for team, _, addresses in (entry.partition("=") for entry in os.environ.get("NOTIFY_TEAM_RECIPIENTS", "").split(";"))
+    if team.strip()
+}
+notifier = Notifier(app)
+inquiry_queue.on_commit(notifier.enqueue)
+
+# Throttle form submissions per client IP and per session ('shared' for multi-worker servers)
+app.config['RATELIMIT_BACKEND'] = os.environ.get("RATELIMIT_BACKEND", "memory")
+app.config['RATELIMIT_FORMS_PER_IP'] = os.environ.get("RATELIMIT_FORMS_PER_IP", "60/hour")
+app.config['RATELIMIT_FORMS_PER_SESSION'] = os.environ.get("RATELIMIT_FORMS_PER_SESSION", "10/10minutes")
+# main.js reports prefetch use when a tab is hidden, at most a few times a minute for a real visitor
+app.config['RATELIMIT_PREFETCH_REPORTS_PER_IP'] = os.environ.get("RATELIMIT_PREFETCH_REPORTS_PER_IP", "120/hour")
+limiter = RateLimiter(app)
+
+# Honeypot, time-to-submit, link-count and blocklist checks ahead of form validation
+app.config['SPAM_MIN_SUBMIT_SECONDS'] = float(os.environ.get("SPAM_MIN_SUBMIT_SECONDS", "3"))
+app.config['SPAM_MAX_LINKS'] = int(os.environ.get("SPAM_MAX_LINKS", "2"))
+app.config['SPAM_BLOCKLIST_PATH'] = os.environ.get("SPAM_BLOCKLIST_PATH") or None
+spam_filter = SpamFilter(app)
+metrics.register_counter('fragment_cache_requests_total', "Layout fragment lookups, by result (hit or miss).",
+                         fragment_cache.requests, ('result',))
+metrics.register_counter('lead_routes_total', "Inquiries assigned by the lead router, by team.",
+                         lead_router.assignments, ('team',))
+metrics.register_counter('prefetch_requests_total', "Prefetch requests, by result (cache, rendered, declined).",
+                         prefetch.requests, ('result',))
+metrics.register_counter('prefetch_outcomes_total', "Prefetched pages reported by main.js, by result (used, unused).",
+                         prefetch.outcomes, ('result',))
+metrics.register_counter('notifications_total', "Inquiry notification attempts, by result (sent, retry, dead).",
+                         notifier.deliveries, ('result',))
+metrics.register_counter('ratelimit_allowed_total', "Form posts admitted by the rate limiter, by scope.",
+                         limiter.allowed, ('scope',))
+metrics.register_counter('ratelimit_limited_total', "Form posts rejected with 429, by scope and bucket.",
+                         limiter.limited, ('scope', 'kind'))
+metrics.register_counter('spam_passed_total', "Form posts that passed the spam pre-filter, by endpoint.",
+                         spam_filter.passed, ('endpoint',))
+metrics.register_counter('spam_rejected_total', "Form posts rejected by the spam pre-filter, by endpoint and reason.",
+                         spam_filter.rejected, ('endpoint', 'reason'))
+
+# Client-side validation rules compiled from the form classes, served as immutable JSON
+form_rules = FormRules(app, forms={'contact': ContactForm, 'service': ServiceInquiryForm})
+validation_failures = Counter()
+metrics.register_counter('form_validation_failures_total', "Form posts that failed server-side validation, by endpoint and field.",
+                         validation_failures, ('endpoint', 'field'))
+
+# Numeric spec search over the catalog, indexed once at startup
+spec_index = SpecIndex(catalog)
+
+# Confirmation shown after a successful submission, by inquiry kind
+THANK_YOU = {
+    'service': 'Thank you for your service inquiry! Our team will contact you within 24 hours.',
+    'contact': 'Thank you for contacting us! We will respond to your message shortly.',
+}
+
+INQUIRY_EVENTS = {
+    'service': ("New service inquiry", 'service_inquiry'),
+    'contact': ("New contact form submission", 'contact_submission'),
+}
+
+def form_payload(form):
+    """Field values of a validated form, without the CSRF token"""
+    return {name: value for name, value in form.data.items() if name != 'csrf_token'}
+
+def submit_inquiry(kind, form):
+    """Route, queue and log a validated form submission; a 503 if the writer is backed up"""
+    inquiry = form_payload(form)
+    assignment = lead_router.route(inquiry)
+    try:
+        inquiry_queue.submit(kind, inquiry, team=assignment.team)
+    except queue.Full:
+        app.logger.error("Inquiry queue full, turning a %s submission away", kind, extra={'event': 'inquiry_queue_full'})
+        abort(503, retry_after=30)
+    message, event = INQUIRY_EVENTS[kind]
+    app.logger.info(message, extra={'event': event, 'fields': {**inquiry, 'team': assignment.team}})
+
+def record_validation_failure(form):
+    """Count a failed post per field; main.js checks the same rules, so these should stay rare"""
+    for name in form.errors:
+        validation_failures[(request.endpoint, name)] += 1
+
+def form_api_response(kind, form):
+    """Validate a form posted to the JSON API: the thank-you message, or the first error per field"""
+    if not form.validate_on_submit():
+        record_validation_failure(form)
+        return jsonify(ok=False, errors={name: errors[0] for name, errors in form.errors.items()}), 422
+    submit_inquiry(kind, form)
+    return jsonify(ok=True, message=THANK_YOU[kind])
+
+def is_api_request():
+    return request.path.startswith('/api/')
+
+@app.route('/')
+@page_cache.cached('index.html')
+def index():
+    """Homepage with overview and key features"""
+    return render_template('index.html')
+
+@app.route('/products')
+@page_cache.cached('products.html')
+def products():
+    """Products catalog with detailed specifications"""
+    return streamer.render('products.html', catalog=catalog)
+
+@app.route('/products/<any(%s):category>' % ', '.join(c.slug for c in catalog.categories))
+def product_category(category):
+    """Products in a single catalog category"""
+    return render_template('product_category.html', category=catalog.category(category),
+                           products=catalog.in_category(category))
+
+@app.route('/products/<slug>')
+def product_detail(slug):
+    """Specification page for a single product"""
+    product = catalog.product(slug)
+    if product is None:
+        abort(404)
+    return render_template('product_detail.html', product=product,
+                           category=catalog.category(product.category))
+
+@app.route('/api/products/search')
+def product_search():
+    """Faceted spec search, e.g. ?capacity=>=1000kN&frequency=2000Hz&dim:force=1kN..5kN&category=structural"""
+    args = request.args.to_dict()
+    category = args.pop('category', None)
+    try:
+        limit = min(int(args.pop('limit', 50)), 500)
+    except ValueError:
+        return jsonify(error="limit must be an integer"), 400
+    if limit < 0:
+        return jsonify(error="limit must not be negative"), 400
+    try:
+        matches = spec_index.search(args, category=category)
+    except KeyError as exc:
+        return jsonify(error=f"Unknown spec {exc.args[0]!r}", facets=spec_index.facets), 400
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(
+        count=matches.bit_count(),
+        facets={'category': spec_index.category_counts(matches)},
+        results=[{
+            'slug': product.slug,
+            'name': product.name,
+            'category': product.category,
+            'url': url_for('product_detail', slug=product.slug),
+            'specs': dict(product.specs),
+        } for product in spec_index.rows(matches, limit)],
+    )
+
+@app.route('/services')
+@page_cache.cached('services.html')
+def services():
+    """Services page with inquiry form"""
+    form = ServiceInquiryForm()
+    return render_template('services.html', form=form)
+
+@app.route('/services', methods=['POST'])
+@limiter.limit('forms')
+@spam_filter.screen
+def services_post():
+    """Handle service inquiry form submission"""
+    form = ServiceInquiryForm()
+    
+    if form.validate_on_submit():
+        # Process the service inquiry
+        submit_inquiry('service', form)
+        
+        flash(THANK_YOU['service'], 'success')
+        return redirect(url_for('services'))
+    
+    # If form validation fails, re-render with errors
+    record_validation_failure(form)
+    return render_template('services.html', form=form)
+
+@app.route('/api/services', methods=['POST'])
+@limiter.limit('forms')
+@spam_filter.screen_json
+def services_api():
+    """Service inquiry submission for main.js; answers in JSON instead of a page"""
+    return form_api_response('service', ServiceInquiryForm())
+
+@app.route('/about')
+@page_cache.cached('about.html')
+def about():
+    """About us page with company information and team"""
+    return streamer.render('about.html')
+
+@app.route('/contact')
+@page_cache.cached('contact.html')
+def contact():
+    """Contact page with contact form"""
+    form = ContactForm()
+    return render_template('contact.html', form=form)
+
+@app.route('/contact', methods=['POST'])
+@limiter.limit('forms')
+@spam_filter.screen
+def contact_post():
+    """Handle contact form submission"""
+    form = ContactForm()
+    
+    if form.validate_on_submit():
+        # Process the contact form
+        submit_inquiry('contact', form)
+        
+        flash(THANK_YOU['contact'], 'success')
+        return redirect(url_for('contact'))
+    
+    # If form validation fails, re-render with errors
+    record_validation_failure(form)
+    return render_template('contact.html', form=form)
+
+@app.route('/api/contact', methods=['POST'])
+@limiter.limit('forms')
+@spam_filter.screen_json
+def contact_api():
+    """Contact form submission for main.js; answers in JSON instead of a page"""
+    return form_api_response('contact', ContactForm())
+
+@app.route('/api/prefetch-report', methods=['POST'])
+@csrf.exempt
+@limiter.limit('prefetch_reports')
+def prefetch_report():
+    """Used/unused prefetch counts, sent by main.js with sendBeacon (which cannot carry a CSRF token)"""
+    return prefetch.report()
+
+@app.errorhandler(404)
+def not_found_error(error):
+    """Handle 404 errors"""
+    return render_template('base.html', error_message="Page not found"), 404
+
+@app.errorhandler(429)
+def too_many_requests_error(error):
+    """Handle rate-limited form submissions"""
+    if is_api_request():
+        response = make_response(jsonify(ok=False, message="Too many submissions, please try again later"), 429)
+    else:
+        response = make_response(render_template('base.html', error_message="Too many submissions, please try again later"), 429)
+    response.retry_after = error.retry_after
+    return response
+
+@app.errorhandler(503)
+def service_unavailable_error(error):
+    """Handle submissions turned away while the inquiry writer catches up"""
+    if is_api_request():
+        response = make_response(jsonify(ok=False, message="We could not take your submission right now, please try again shortly"), 503)
+    else:
+        response = make_response(render_template('base.html', error_message="We could not take your submission right now, please try again shortly"), 503)
+    response.retry_after = error.retry_after
+    return response
+
+@app.errorhandler(CSRFError)
+def csrf_error(error):
+    """Answer rejected CSRF tokens in JSON on the API; form pages keep the plain 400"""
+    if is_api_request():
+        return jsonify(ok=False, message="Your form has expired. Please reload the page and try again.",
+                       reason=error.description), 400
+    return error
+
+@app.errorhandler(500)
+def internal_error(error):
+    """Handle 500 errors"""
+    return render_template('base.html', error_message="Internal server error"), 500
+
+def warm_templates():
+    """Compile every template up front so no request pays for Jinja parsing"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+# Render the cached pages once so the first visitors don't pay for Jinja
+warm_templates()
+vendor_assets.load()
+assets.build()
+page_cache.warm()
+compress.prepare_static()
+
+def start_background_services():
+    """Start the inquiry writer, notifier and metrics flusher, and pick up anything a previous process left pending"""
+    metrics.start()
+    notifier.start()
+    inquiry_queue.start()
+    inquiry_queue.replay()
+
+if __name__ == '__main__':
+    # serve.py starts these in each forked worker; with the reloader, only the
+    # child process that actually serves requests needs them
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        compress.prepare_static(build=True)
+        metrics.clear_files()
+        start_background_services()
+    app.run(host='0.0.0.0', port=5000, debug=True)
+from app import app
+from flask_wtf import FlaskForm
+from wtforms import StringField, TextAreaField, SelectField, EmailField, TelField
+from wtforms.validators import DataRequired, Email, Length, Optional
+from csrf_tokens import FormCSRF
+
+class ContactForm(FlaskForm):
+    """Contact form with validation"""
+    class Meta:
+        csrf_class = FormCSRF
+
+    name = StringField('Full Name', validators=[
+        DataRequired(message='Please enter your full name'),
+        Length(min=2, max=100, message='Name must be between 2 and 100 characters')
+    ])
+    
+    email = EmailField('Email Address', validators=[
+        DataRequired(message='Please enter your email address'),
+        Email(message='Please enter a valid email address')
+    ])
+    
+    subject = StringField('Subject', validators=[
+        DataRequired(message='Please enter a subject'),
+        Length(min=5, max=200, message='Subject must be between 5 and 200 characters')
+    ])
+    
+    message = TextAreaField('Message', validators=[
+        DataRequired(message='Please enter your message'),
+        Length(min=10, max=2000, message='Message must be between 10 and 2000 characters')
+    ])
+
+class ServiceInquiryForm(FlaskForm):
+    """Service inquiry form for custom quotes"""
+    class Meta:
+        csrf_class = FormCSRF
+
+    company = StringField('Company Name', validators=[
+        DataRequired(message='Please enter your company name'),
+        Length(min=2, max=150, message='Company name must be between 2 and 150 characters')
+    ])
+    
+    name = StringField('Contact Person', validators=[
+        DataRequired(message='Please enter the contact person name'),
+        Length(min=2, max=100, message='Name must be between 2 and 100 characters')
+    ])
+    
+    email = EmailField('Email Address', validators=[
+        DataRequired(message='Please enter your email address'),
+        Email(message='Please enter a valid email address')
+    ])
+    
+    phone = TelField('Phone Number', validators=[
+        Optional(),
+        Length(min=10, max=20, message='Phone number must be between 10 and 20 characters')
+    ])
+    
+    service_type = SelectField('Service Type', choices=[
+        ('', 'Select a service type...'),
+        ('structural_testing', 'Structural Load & Response Testing'),
+        ('ndt_inspection', 'Non-Destructive Testing & Inspection'),
+        ('geotechnical_testing', 'Geotechnical & Foundation Testing'),
+        ('custom_solution', 'Custom Testing Solution'),
+        ('equipment_rental', 'Equipment Rental'),
+        ('training_certification', 'Training & Certification'),
+        ('consultation', 'Engineering Consultation')
+    ], validators=[
+        DataRequired(message='Please select a service type')
+    ])
+    
+    project_details = TextAreaField('Project Details', validators=[
+        DataRequired(message='Please provide project details'),
+        Length(min=20, max=3000, message='Project details must be between 20 and 3000 characters')
+    ])
+"""Pre-rendered page snapshots, with per-request holes for form tokens."""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, g, request, session, url_for
+from jinja2 import meta
+
+from partials import PARTIAL_HEADER
+
+# Stands in for a per-request value inside a snapshot; replaced on every hit
+PLACEHOLDER = '\x00page-cache:{}\x00'
+
+
+def flashes_pending():
+    """Whether flashed messages are waiting to be shown to this visitor.
+
+    Flashes only ever arrive with the session cookie, so without one the
+    session is not loaded at all: reading it makes Flask add ``Vary: Cookie``
+    to the response, which would keep shared caches from storing the page.
+    """
+    if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+        return False
+    return bool(session.get('_flashes'))
+
+
+class PageCache:
+    """In-process cache of fully rendered HTML pages.
+
+    Entries are keyed by ``(endpoint, has_flashes, partial)``, ``partial``
+    being a content-only render for in-place navigation. Only the
+    flash-free variants are stored: a page carrying flashed messages is rendered live so
+    the messages are consumed exactly once. Hits carry the snapshot's ETag
+    and build time as ``Last-Modified``.
+
+    Values that differ per request, such as a stateless CSRF token or the
+    spam filter's render stamp, ask for a ``placeholder()`` while the
+    snapshot is built and are filled in on each hit; such pages are sent
+    as ``private``. A build that touches session state instead (a
+    session-bound CSRF token) leaves its page rendered live.
+    """
+
+    def __init__(self, app=None):
+        self._entries = {}
+        self._views = {}
+        self._fillers = {}
+        self._live = set()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_CHECK_INTERVAL', 1.0)
+        app.extensions['page_cache'] = self
+        app.add_template_global(flashes_pending)
+
+    def cached(self, template_name):
+        """Serve the decorated view from the snapshot cache.
+
+        ``template_name`` is the template the view renders; it and every
+        template it extends or includes are watched for changes.
+        """
+        def decorator(view):
+            self._views[view.__name__] = (view, template_name)
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.app.config['PAGE_CACHE_ENABLED']:
+                    return view(*args, **kwargs)
+                key = (request.endpoint, flashes_pending(), self._partial_requested())
+                entry = self._lookup(key)
+                if entry is None:
+                    return view(*args, **kwargs)
+                g.page_cache_hit = True
+                body, etag, built_at, _, holes = entry
+                if holes:
+                    response = Response(self._fill(body, holes), mimetype='text/html')
+                    response.cache_control.private = True
+                    response.cache_control.no_cache = True
+                    return response
+                response = Response(body, mimetype='text/html')
+                response.set_etag(etag)
+                response.last_modified = built_at
+                return response
+            return wrapper
+        return decorator
+
+    def warm(self):
+        """Render every registered page once; call after routes are defined."""
+        if not self.app.config['PAGE_CACHE_ENABLED']:
+            return
+        variants = (False, True) if 'partial_navigation' in self.app.extensions else (False,)
+        for endpoint in self._views:
+            for partial in variants:
+                self._build(endpoint, partial)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._live.clear()
+
+    def serves(self, endpoint):
+        """Whether ``endpoint`` is answered from a snapshot (flash-free requests only)."""
+        return (self.app.config['PAGE_CACHE_ENABLED'] and endpoint in self._views
+                and endpoint not in self._live)
+
+    def placeholder(self, name, fill):
+        """Return a marker for a per-request value while a snapshot is built, else ``None``.
+
+        ``fill()`` produces the real value on each cache hit.
+        """
+        if not g.get('_page_cache_build'):
+            return None
+        self._fillers[name] = fill
+        return PLACEHOLDER.format(name)
+
+    def _fill(self, body, holes):
+        for name in holes:
+            body = body.replace(PLACEHOLDER.format(name).encode(), self._fillers[name]().encode())
+        return body
+
+    def _partial_requested(self):
+        partial_navigation = self.app.extensions.get('partial_navigation')
+        return partial_navigation is not None and partial_navigation.requested()
+
+    def _lookup(self, key):
+        endpoint, has_flashes, partial = key
+        if has_flashes or endpoint not in self._views or endpoint in self._live:
+            return None
+        self._check_templates()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._build(endpoint, partial)
+        return entry
+
+    def _check_templates(self):
+        now = time.monotonic()
+        if now - self._last_check < self.app.config['PAGE_CACHE_CHECK_INTERVAL']:
+            return
+        self._last_check = now
+        stale = [key for key, (_, _, _, uptodate, _) in list(self._entries.items())
+                 if not all(check() for check in uptodate)]
+        if stale:
+            with self._lock:
+                for key in stale:
+                    self._entries.pop(key, None)
+            self.app.logger.info("Page cache invalidated: %s", ', '.join(k[0] for k in stale))
+
+    def _build(self, endpoint, partial=False):
+        view, template_name = self._views[endpoint]
+        key = (endpoint, False, partial)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            uptodate = self._template_watchers(template_name)
+            with self.app.test_request_context():
+                path = url_for(endpoint)
+            # A fresh app context, so the build's ``g`` never leaks into a request it runs inside
+            headers = {PARTIAL_HEADER: 'content'} if partial else None
+            with self.app.app_context(), self.app.test_request_context(path, headers=headers):
+                g._page_cache_build = True
+                response = self.app.make_response(view())
+                per_session = 'csrf_token' in g
+            if per_session:
+                self._live.add(endpoint)
+                return None
+            if response.status_code != 200:
+                return None
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            holes = tuple(name for name in self._fillers if PLACEHOLDER.format(name).encode() in body)
+            entry = (body, etag, time.time(), uptodate, holes)
+            self._entries[key] = entry
+            return entry
+
+    def _template_watchers(self, template_name):
+        """Return the ``uptodate`` callables for a template and its parents."""
+        env = self.app.jinja_env
+        pending, seen, watchers = [template_name], set(), []
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            source, _, uptodate = env.loader.get_source(env, name)
+            if uptodate is not None:
+                watchers.append(uptodate)
+            pending.extend(ref for ref in meta.find_referenced_templates(env.parse(source)) if ref)
+        return watchers
+"""Durable storage for form submissions with a background group-commit writer."""
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class InquiryBackend:
+    """Persistence interface for submitted inquiries.
+
+    Records are dicts with ``id``, ``kind``, ``created_at``, ``data`` and the
+    routed ``team``. ``write_batch`` must store the whole batch atomically;
+    records stay pending until ``mark_processed`` is called for them. A
+    claim is only a lease: a claimed record that is neither processed nor
+    released becomes claimable again once the lease runs out.
+    """
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+    def mark_processed(self, ids):
+        raise NotImplementedError
+
+    def claim_pending(self, older_than, lease):
+        """Return pending records created before ``older_than`` and claim them for ``lease`` seconds."""
+        raise NotImplementedError
+
+    def release(self, ids):
+        """Return claimed records to the pending state."""
+        raise NotImplementedError
+
+    def all_assignments(self):
+        """Return ``(id, data, team)`` for every stored record."""
+        raise NotImplementedError
+
+    def assign_teams(self, pairs):
+        """Store new teams from ``(id, team)`` pairs."""
+        raise NotImplementedError
+
+
+class SQLiteBackend(InquiryBackend):
+    """SQLite store in WAL mode; safe to share between worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS inquiries ('
+            ' id TEXT PRIMARY KEY,'
+            ' kind TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' processed_at REAL,'
+            ' claimed_at REAL,'
+            ' team TEXT,'
+            ' service_type TEXT,'
+            ' email_domain TEXT)'
+        )
+        add_missing_column(conn, 'inquiries', 'claimed_at', 'REAL')
+        add_missing_column(conn, 'inquiries', 'team', 'TEXT')
+        add_missing_column(conn, 'inquiries', 'service_type', 'TEXT')
+        if add_missing_column(conn, 'inquiries', 'email_domain', 'TEXT'):
+            conn.execute("UPDATE inquiries SET service_type = json_extract(payload, '$.service_type'),"
+                         " email_domain = lower(substr(json_extract(payload, '$.email'),"
+                         " instr(json_extract(payload, '$.email'), '@') + 1))")
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_inquiries_pending '
+                     'ON inquiries (created_at) WHERE processed_at IS NULL')
+        # Keyset pagination for the admin views walks (created_at, id) within each filter
+        for column in (None, 'service_type', 'email_domain', 'team'):
+            name = f'ix_inquiries_{column or "created"}'
+            columns = f'{column}, created_at, id' if column else 'created_at, id'
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON inquiries ({columns})')
+        self._create_search_index(conn)
+        self._conn = conn
+
+    @staticmethod
+    def _create_search_index(conn):
+        """Full-text index over message/project_details, kept current by a trigger."""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'inquiries_fts'").fetchone():
+            return
+        try:
+            conn.execute("CREATE VIRTUAL TABLE inquiries_fts USING fts5(body, content='')")
+        except sqlite3.OperationalError:
+            return  # SQLite built without FTS5; search falls back to LIKE
+        body = ("coalesce(json_extract({0}.payload, '$.message'), '') || ' ' || "
+                "coalesce(json_extract({0}.payload, '$.project_details'), '')")
+        conn.execute('CREATE TRIGGER inquiries_fts_insert AFTER INSERT ON inquiries BEGIN '
+                     f'INSERT INTO inquiries_fts (rowid, body) VALUES (new.rowid, {body.format("new")}); END')
+        conn.execute(f'INSERT INTO inquiries_fts (rowid, body) SELECT rowid, {body.format("inquiries")} '
+                     'FROM inquiries')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def write_batch(self, records):
+        rows = [(r['id'], r['kind'], r['created_at'], json.dumps(r['data']), r.get('team'),
+                 r['data'].get('service_type') or None,
+                 r['data'].get('email', '').rpartition('@')[2].lower() or None)
+                for r in records]
+        with self._transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO inquiries '
+                             '(id, kind, created_at, payload, team, service_type, email_domain) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def mark_processed(self, ids):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany('UPDATE inquiries SET processed_at = ? WHERE id = ?',
+                             [(now, record_id) for record_id in ids])
+
+    def claim_pending(self, older_than, lease):
+        now = time.time()
+        with self._transaction(immediate=True) as conn:
+            rows = conn.execute('SELECT id, kind, created_at, payload, team FROM inquiries '
+                                'WHERE processed_at IS NULL AND created_at < ? '
+                                'AND (claimed_at IS NULL OR claimed_at < ?) '
+                                'ORDER BY created_at', (older_than, now - lease)).fetchall()
+            conn.executemany('UPDATE inquiries SET claimed_at = ? WHERE id = ?',
+                             [(now, row[0]) for row in rows])
+        return [{'id': row[0], 'kind': row[1], 'created_at': row[2], 'data': json.loads(row[3]),
+                 'team': row[4]} for row in rows]
+
+    def release(self, ids):
+        with self._transaction() as conn:
+            conn.executemany('UPDATE inquiries SET claimed_at = NULL WHERE id = ?',
+                             [(record_id,) for record_id in ids])
+
+    def all_assignments(self):
+        rows = self._conn.execute('SELECT id, payload, team FROM inquiries ORDER BY created_at')
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def assign_teams(self, pairs):
+        with self._transaction() as conn:
+            conn.executemany('UPDATE inquiries SET team = ? WHERE id = ?',
+                             [(team, record_id) for record_id, team in pairs])
+
+    def _transaction(self, immediate=False):
+        return _Transaction(self._conn, 'BEGIN IMMEDIATE' if immediate else 'BEGIN')
+
+
+class _Transaction:
+    def __init__(self, conn, begin):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def add_missing_column(conn, table, column, declaration):
+    """Add ``column`` to a table created by an older version of the schema.
+
+    Returns whether the column was added, so the caller can backfill it.
+    """
+    if column in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return True
+
+
+class InquiryReader:
+    """Filtered, keyset-paginated reads of the SQLite inquiry store.
+
+    Each call opens its own query-only connection, so reads never share a
+    connection (or a transaction) with the writer thread. Results are
+    ordered newest first by ``(created_at, id)``; a page ends with the
+    cursor to pass as ``after`` for the next one. ``filters`` may hold
+    ``service_type``, ``domain``, ``team``, ``since``/``until`` (epoch
+    seconds) and ``q`` (full-text words). Until the writer has created the
+    store, every read is empty.
+    """
+
+    COLUMNS = 'id, kind, created_at, payload, team'
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        """A query-only connection, or ``None`` if there is no inquiries table yet."""
+        if not os.path.exists(self.path):
+            return None
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA query_only = ON')
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'inquiries'").fetchone() is None:
+            conn.close()
+            return None
+        return conn
+
+    def page(self, filters, after=None, limit=50):
+        """Return ``(records, next_cursor)``; ``next_cursor`` is ``None`` on the last page."""
+        conn = self.connect()
+        if conn is None:
+            return [], None
+        try:
+            rows = conn.execute(*self._query(conn, filters, after, limit + 1)).fetchall()
+        finally:
+            conn.close()
+        records = [self._record(row) for row in rows[:limit]]
+        cursor = (records[-1]['created_at'], records[-1]['id']) if len(rows) > limit else None
+        return records, cursor
+
+    def iter_records(self, filters, chunk_size=500):
+        """Yield every matching record, reading ``chunk_size`` rows at a time."""
+        conn = self.connect()
+        if conn is None:
+            return
+        try:
+            after = None
+            while True:
+                rows = conn.execute(*self._query(conn, filters, after, chunk_size)).fetchall()
+                for row in rows:
+                    yield self._record(row)
+                if len(rows) < chunk_size:
+                    return
+                after = (rows[-1][2], rows[-1][0])
+        finally:
+            conn.close()
+
+    def _query(self, conn, filters, after, limit):
+        clauses, params = [], []
+        for key, column in (('service_type', 'service_type'), ('domain', 'email_domain'), ('team', 'team')):
+            if filters.get(key):
+                clauses.append(f'{column} = ?')
+                params.append(filters[key])
+        if filters.get('since') is not None:
+            clauses.append('created_at >= ?')
+            params.append(filters['since'])
+        if filters.get('until') is not None:
+            clauses.append('created_at < ?')
+            params.append(filters['until'])
+        words = re.findall(r'\w+', filters.get('q') or '')
+        if words:
+            if self._has_search_index(conn):
+                clauses.append('rowid IN (SELECT rowid FROM inquiries_fts WHERE inquiries_fts MATCH ?)')
+                params.append(' '.join(f'"{word}"' for word in words))
+            else:
+                for word in words:
+                    clauses.append('payload LIKE ?')
+                    params.append(f'%{word}%')
+        if after is not None:
+            clauses.append('(created_at, id) < (?, ?)')
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ''
+        sql = f'SELECT {self.COLUMNS} FROM inquiries {where}ORDER BY created_at DESC, id DESC LIMIT ?'
+        return sql, (*params, limit)
+
+    @staticmethod
+    def _has_search_index(conn):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'inquiries_fts'").fetchone() is not None
+
+    @staticmethod
+    def _record(row):
+        return {'id': row[0], 'kind': row[1], 'created_at': row[2], 'data': json.loads(row[3]), 'team': row[4]}
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+}
+
+
+class InquiryQueue:
+    """Accepts submissions in memory and persists them from a writer thread.
+
+    The writer blocks for the first record, then gathers whatever else
+    arrives within ``INQUIRY_FLUSH_INTERVAL`` (up to ``INQUIRY_BATCH_SIZE``)
+    and commits the batch in one transaction. Committed records are handed
+    to the ``on_commit`` handlers and then marked processed; anything left
+    pending by a crash is replayed to the handlers on the next start, or by
+    the writer once it has been idle for ``INQUIRY_CLAIM_LEASE`` seconds.
+    Replays claim their records for that long, so a process that dies
+    mid-replay only delays them.
+    """
+
+    _STOP = object()
+    WRITE_ATTEMPTS = 3
+
+    def __init__(self, app=None):
+        self._handlers = []
+        self._queue = None
+        self._thread = None
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('INQUIRY_BACKEND', 'sqlite')
+        app.config.setdefault('INQUIRY_DB_PATH', os.path.join(app.instance_path, 'inquiries.db'))
+        app.config.setdefault('INQUIRY_BATCH_SIZE', 100)
+        app.config.setdefault('INQUIRY_FLUSH_INTERVAL', 0.05)
+        app.config.setdefault('INQUIRY_QUEUE_SIZE', 10000)
+        app.config.setdefault('INQUIRY_SUBMIT_TIMEOUT', 1.0)
+        app.config.setdefault('INQUIRY_REPLAY_GRACE', 60)
+        app.config.setdefault('INQUIRY_CLAIM_LEASE', 300)
+        app.extensions['inquiry_queue'] = self
+
+    def on_commit(self, handler):
+        """Register ``handler(records)`` to run after each committed batch."""
+        self._handlers.append(handler)
+        return handler
+
+    def open_backend(self):
+        """Open the configured backend without starting the writer."""
+        if self.backend is None:
+            config = self.app.config
+            self.backend = BACKENDS[config['INQUIRY_BACKEND']](config['INQUIRY_DB_PATH'])
+            self.backend.open()
+        return self.backend
+
+    def start(self):
+        if self._thread is not None:
+            return
+        config = self.app.config
+        self.open_backend()
+        self._queue = queue.Queue(maxsize=config['INQUIRY_QUEUE_SIZE'])
+        self._thread = threading.Thread(target=self._run, name='inquiry-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        self.backend.close()
+        self.backend = None
+
+    def submit(self, kind, data, team=None):
+        """Queue a validated submission and return its id without touching disk.
+
+        Raises ``queue.Full`` if the writer is still ``INQUIRY_QUEUE_SIZE``
+        records behind after ``INQUIRY_SUBMIT_TIMEOUT`` seconds.
+        """
+        if self._thread is None:
+            raise RuntimeError("InquiryQueue.submit() called before start(); nothing would persist it")
+        record = {'id': uuid.uuid4().hex, 'kind': kind, 'created_at': time.time(), 'data': data, 'team': team}
+        self._queue.put(record, timeout=self.app.config['INQUIRY_SUBMIT_TIMEOUT'])
+        return record['id']
+
+    def replay(self):
+        """Hand submissions left pending by an earlier process to the handlers."""
+        config = self.app.config
+        older_than = time.time() - config['INQUIRY_REPLAY_GRACE']
+        records = self.backend.claim_pending(older_than, config['INQUIRY_CLAIM_LEASE'])
+        if records:
+            self.app.logger.warning("Replaying %d pending inquiries", len(records))
+            if not self._dispatch(records):
+                self.backend.release([r['id'] for r in records])
+        return len(records)
+
+    def _run(self):
+        batch_size = self.app.config['INQUIRY_BATCH_SIZE']
+        flush_interval = self.app.config['INQUIRY_FLUSH_INTERVAL']
+        idle_timeout = self.app.config['INQUIRY_CLAIM_LEASE']
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=idle_timeout)
+            except queue.Empty:
+                self._replay_safely()
+                continue
+            if first is self._STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    record = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            try:
+                self._commit(batch)
+            except Exception:
+                # Never let the writer die: request threads block on a full queue
+                self.app.logger.exception("Inquiry writer failed on a batch of %d", len(batch))
+
+    def _replay_safely(self):
+        try:
+            self.replay()
+        except Exception:
+            self.app.logger.exception("Replay of pending inquiries failed")
+
+    def _commit(self, batch):
+        for attempt in range(self.WRITE_ATTEMPTS):
+            try:
+                self.backend.write_batch(batch)
+                break
+            except Exception:
+                self.app.logger.exception("Failed to persist %d inquiries (attempt %d)",
+                                          len(batch), attempt + 1)
+                time.sleep(0.1 * 2 ** attempt)
+        else:
+            # Last resort: keep the leads in the error log rather than drop them
+            for record in batch:
+                self.app.logger.error("Unpersisted inquiry: %s", json.dumps(record))
+            return
+        self._dispatch(batch)
+
+    def _dispatch(self, records):
+        try:
+            for handler in self._handlers:
+                handler(records)
+        except Exception:
+            self.app.logger.exception("Inquiry handler failed; %d records left pending", len(records))
+            return False
+        try:
+            self.backend.mark_processed([r['id'] for r in records])
+        except Exception:
+            # The handlers ran; the records stay pending and are replayed later
+            self.app.logger.exception("Failed to mark %d inquiries processed", len(records))
+        return True
+"""Queue-backed structured logging so request threads never wait on log output."""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+
+class JsonFormatter(logging.Formatter):
+    """Render each record as one JSON object per line.
+
+    Structured data is attached with ``extra={'event': ..., 'fields': {...}}``.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry['fields'] = fields
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records untouched so formatting happens on the listener thread.
+
+    The stock ``QueueHandler.prepare`` formats the message eagerly, which is
+    only needed when records cross a process boundary.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level='DEBUG', use_queue=True, stream=None):
+    """Install JSON logging on the root logger.
+
+    With ``use_queue`` the request thread only appends the record to an
+    in-memory queue; a ``QueueListener`` thread formats and writes it.
+    Returns the listener, or ``None`` in synchronous mode.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if not use_queue:
+        root.handlers[:] = [handler]
+        return None
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    root.handlers[:] = [queue_handler]
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_in_child():
+        # The listener thread does not survive fork(), and a QueueListener
+        # cannot be started twice (3.12+): give the child a queue and listener of its own
+        fresh = queue.SimpleQueue()
+        queue_handler.queue = fresh
+        child_listener = logging.handlers.QueueListener(fresh, handler, respect_handler_level=True)
+        child_listener.start()
+        atexit.register(child_listener.stop)
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return listener
+"""Content-negotiated gzip/brotli compression for static files and rendered pages."""
+import gzip
+import mimetypes
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class Compress:
+    """Compress responses for clients that advertise ``Accept-Encoding``.
+
+    Static files are compressed once by the launcher (or the ``flask
+    precompress-static`` command) and served from their ``.br``/``.gz``
+    siblings, which ``prepare_static()`` indexes. Rendered pages above ``COMPRESS_MIN_SIZE`` are compressed in the
+    ``after_request`` hook; streamed responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app=None):
+        self._precompressed = {}
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIMETYPES', {
+            'text/html', 'text/css', 'text/plain', 'text/javascript',
+            'application/javascript', 'application/json', 'image/svg+xml',
+        })
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_LEVEL', 5)
+        app.config.setdefault('COMPRESS_STATIC_BUILD', True)
+        app.config.setdefault('COMPRESS_MEMO_SIZE', 128)
+        app.extensions['compress'] = self
+        app.view_functions['static'] = self.send_static
+        app.after_request(self.after_request)
+        app.cli.command('precompress-static')(self._precompress_command)
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self):
+        """Return the best encoding the client accepts, or ``None``."""
+        if not self.app.config['COMPRESS_ENABLED']:
+            return None
+        return request.accept_encodings.best_match(self.encodings)
+
+    def prepare_static(self, build=False):
+        """Index the precompressed siblings; with ``build``, first write any that are missing or stale."""
+        if build and self.app.config['COMPRESS_STATIC_BUILD']:
+            self.precompress_static()
+        self._precompressed = {}
+        for filename, path in self._compressible_static_files():
+            available = {encoding for encoding, suffix in SUFFIXES.items()
+                         if _is_fresh(path + suffix, path)}
+            if available:
+                self._precompressed[filename] = available
+
+    def precompress_static(self):
+        """Write ``.gz`` (and ``.br`` when available) next to each static asset."""
+        written = 0
+        for _, path in self._compressible_static_files():
+            with open(path, 'rb') as f:
+                data = f.read()
+            targets = [('gzip', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append(('br', lambda d: brotli.compress(d, quality=11)))
+            for encoding, compress in targets:
+                target = path + SUFFIXES[encoding]
+                if _is_fresh(target, path):
+                    continue
+                # Another process may be serving or writing the same sibling
+                tmp = f'{target}.{os.getpid()}.tmp'
+                try:
+                    with open(tmp, 'wb') as f:
+                        f.write(compress(data))
+                    os.replace(tmp, target)
+                    written += 1
+                except OSError as exc:
+                    self.app.logger.warning("Cannot write %s: %s", target, exc)
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+        return written
+
+    def send_static(self, filename):
+        """Static view that prefers a precompressed sibling of the file."""
+        available = self._precompressed.get(filename)
+        encoding = self.negotiate() if available else None
+        if available and encoding in available:
+            mimetype, _ = mimetypes.guess_type(filename)
+            response = send_from_directory(
+                self.app.static_folder, filename + SUFFIXES[encoding],
+                mimetype=mimetype, max_age=self.app.get_send_file_max_age(filename),
+            )
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = self.app.send_static_file(filename)
+        if available:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def after_request(self, response):
+        if not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding_for(response)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._stream(response.iter_encoded(), response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            etag, weak = response.get_etag()
+            response.set_data(self._compress_memoized(data, encoding, None if weak else etag))
+            if etag:
+                response.set_etag(f'{etag}-{encoding}', weak=weak)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compressible(self, response):
+        return not (response.direct_passthrough
+                    or response.status_code != 200
+                    or 'Content-Encoding' in response.headers
+                    or response.mimetype not in self.app.config['COMPRESS_MIMETYPES']
+                    or response.cache_control.no_transform)
+
+    def encoding_for(self, response):
+        """The encoding ``after_request`` will give ``response``, or ``None`` if it is sent as is."""
+        if not self._compressible(response):
+            return None
+        if not response.is_streamed and len(response.get_data()) < self.app.config['COMPRESS_MIN_SIZE']:
+            return None
+        return self.negotiate()
+
+    def _compress_memoized(self, data, encoding, etag):
+        """Compress ``data``, reusing earlier output for the same strong ETag."""
+        if etag is None:
+            return self._compress(data, encoding)
+        key = (etag, encoding)
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        compressed = self._compress(data, encoding)
+        with self._memo_lock:
+            self._memo[key] = compressed
+            while len(self._memo) > self.app.config['COMPRESS_MEMO_SIZE']:
+                self._memo.popitem(last=False)
+        return compressed
+
+    def _compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.app.config['COMPRESS_BR_LEVEL'])
+        return gzip.compress(data, compresslevel=self.app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+    def _stream(self, chunks, source, encoding):
+        """Compress a streamed body, flushing after each chunk the view yields."""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.app.config['COMPRESS_BR_LEVEL'])
+            compress = lambda chunk: compressor.process(chunk) + compressor.flush()
+            finish = compressor.finish
+        else:
+            compressor = zlib.compressobj(self.app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 31)
+            compress = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            finish = compressor.flush
+        try:
+            for chunk in chunks:
+                data = compress(chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+    def _compressible_static_files(self):
+        static_folder = self.app.static_folder
+        if not static_folder or not os.path.isdir(static_folder):
+            return
+        compressible = self.app.config['COMPRESS_MIMETYPES']
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                mimetype, encoding = mimetypes.guess_type(name)
+                if encoding is not None or mimetype not in compressible:
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+    def _precompress_command(self):
+        """Write .gz/.br siblings for every compressible static file."""
+        written = self.precompress_static()
+        print(f"Wrote {written} precompressed files")
+
+
+def _is_fresh(target, source):
+    try:
+        return os.stat(target).st_mtime >= os.stat(source).st_mtime
+    except OSError:
+        return False
+"""Content-hashed static URLs backed by an in-memory asset manifest."""
+import hashlib
+import json
+import os
+from functools import wraps
+
+from flask import current_app
+
+IMMUTABLE_MAX_AGE = 31536000
+SKIP_SUFFIXES = ('.gz', '.br')
+
+
+class AssetManifest:
+    """Fingerprint static files so they can be cached forever.
+
+    ``url_for('static', filename='css/style.css')`` becomes
+    ``/static/css/style.<hash>.css``; the static view maps the hashed name
+    back to the file and marks the response immutable. Fingerprinting is
+    skipped while the app runs in debug mode so edits show up immediately.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self._originals = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('ASSET_FINGERPRINT', True)
+        app.config.setdefault('ASSET_HASH_LENGTH', 12)
+        app.extensions['assets'] = self
+        app.url_defaults(self._hashed_url)
+        app.view_functions['static'] = self._wrap_static(app.view_functions['static'])
+        app.cli.command('asset-manifest')(self._manifest_command)
+
+    def build(self):
+        """Hash every static file and rebuild the manifest."""
+        manifest = {}
+        static_folder = self.app.static_folder
+        if static_folder and os.path.isdir(static_folder):
+            length = self.app.config['ASSET_HASH_LENGTH']
+            for root, _, files in os.walk(static_folder):
+                for name in files:
+                    if name.endswith(SKIP_SUFFIXES):
+                        continue
+                    path = os.path.join(root, name)
+                    with open(path, 'rb') as f:
+                        digest = hashlib.sha256(f.read()).hexdigest()[:length]
+                    filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                    stem, ext = os.path.splitext(filename)
+                    manifest[filename] = f'{stem}.{digest}{ext}'
+        self.manifest = manifest
+        self._originals = {hashed: original for original, hashed in manifest.items()}
+        return manifest
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint != 'static' or current_app.debug or not self.app.config['ASSET_FINGERPRINT']:
+            return
+        hashed = self.manifest.get(values.get('filename'))
+        if hashed is not None:
+            values['filename'] = hashed
+
+    def _wrap_static(self, view):
+        @wraps(view)
+        def send_static(filename):
+            original = self._originals.get(filename)
+            if original is None:
+                return view(filename)
+            response = view(original)
+            if response.status_code == 200:
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = IMMUTABLE_MAX_AGE
+                response.cache_control.immutable = True
+            return response
+        return send_static
+
+    def _manifest_command(self):
+        """Print the static asset manifest as JSON."""
+        print(json.dumps(self.build(), indent=2, sort_keys=True))
+"""Build step that self-hosts a trimmed copy of Bootstrap and Font Awesome."""
+import io
+import os
+import re
+import urllib.request
+
+import click
+from markupsafe import Markup
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:  # fonttools is optional; fonts are copied whole without it
+    font_subset = None
+
+BOOTSTRAP_CDN = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist'
+FONT_AWESOME_CDN = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+SOURCES = {
+    'bootstrap.min.css': f'{BOOTSTRAP_CDN}/css/bootstrap.min.css',
+    'bootstrap.bundle.min.js': f'{BOOTSTRAP_CDN}/js/bootstrap.bundle.min.js',
+    'all.min.css': f'{FONT_AWESOME_CDN}/css/all.min.css',
+}
+FONT_FILES = {
+    'fa-solid-900': ('fas', 'fa-solid'),
+    'fa-regular-400': ('far', 'fa-regular'),
+    'fa-brands-400': ('fab', 'fa-brands'),
+}
+
+# Classes Bootstrap's JavaScript adds at runtime, so they never appear in templates
+BOOTSTRAP_SAFELIST = {
+    'show', 'showing', 'hiding', 'collapse', 'collapsing', 'fade', 'active', 'disabled',
+    'is-valid', 'is-invalid', 'was-validated', 'tooltip', 'tooltip-inner', 'tooltip-arrow',
+    'bs-tooltip-auto', 'bs-tooltip-top', 'bs-tooltip-bottom', 'bs-tooltip-start', 'bs-tooltip-end',
+}
+
+NESTED_AT_RULES = ('@media', '@supports', '@layer', '@container')
+LICENSE_RE = re.compile(r'/\*!.*?\*/', re.S)
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+TOKEN_RE = re.compile(r'[A-Za-z0-9_-]+')
+# A class prefix followed by a Jinja ({{ }}) or JavaScript template (${ }) expression
+DYNAMIC_CLASS_RE = re.compile(r'([\w-]*-)(?:\{\{(.*?)\}\}|\$\{(.*?)\})', re.S)
+QUOTED_RE = re.compile(r'''['"]([\w-]+)['"]''')
+PSEUDO_FUNCTION_RE = re.compile(r':(?:not|is|where|has)\([^()]*\)')
+CLASS_RE = re.compile(r'[.#]((?:\\.|[\w-])+)')
+CODEPOINT_RE = re.compile(r'content:\s*"\\([0-9a-fA-F]+)"')
+KEYFRAMES_RE = re.compile(r'@(?:-webkit-)?keyframes\s+([\w-]+)')
+FONT_URL_RE = re.compile(r'url\(["\']?[^)"\']*/([\w-]+)\.woff2["\']?\)')
+
+
+class VendorAssets:
+    """Serve Bootstrap and Font Awesome from the app instead of public CDNs.
+
+    ``flask vendor-assets`` writes ``static/vendor/`` with a purged
+    Bootstrap + Font Awesome stylesheet, the Bootstrap bundle, subsetted
+    icon fonts and a critical stylesheet for the shared layout. With
+    ``VENDOR_ASSETS = 'local'`` the layout inlines the critical CSS and loads
+    the rest without blocking render.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('VENDOR_ASSETS', 'cdn')
+        app.config.setdefault('VENDOR_EXTRA_CLASSES', ())
+        app.extensions['vendor_assets'] = self
+        app.jinja_env.globals['vendor_critical_css'] = Markup('')
+
+        @app.cli.command('vendor-assets')
+        @click.option('--source', type=click.Path(exists=True, file_okay=False),
+                      help='Directory holding the upstream files instead of downloading them.')
+        def vendor_assets_command(source):
+            """Download, purge and subset Bootstrap and Font Awesome into static/vendor."""
+            for name, size in self.build(source).items():
+                print(f"{name}: {size / 1024:.1f} KiB")
+
+    @property
+    def output_dir(self):
+        return os.path.join(self.app.static_folder, 'vendor')
+
+    def load(self):
+        """Switch to local vendor files if they have been built."""
+        if self.app.config['VENDOR_ASSETS'] != 'local':
+            return
+        critical = os.path.join(self.output_dir, 'critical.css')
+        if not os.path.exists(critical):
+            self.app.logger.warning("static/vendor is missing; run 'flask vendor-assets'. Using CDNs.")
+            self.app.config['VENDOR_ASSETS'] = 'cdn'
+            return
+        with open(critical, encoding='utf-8') as f:
+            self.app.jinja_env.globals['vendor_critical_css'] = Markup(f.read())
+
+    def build(self, source=None):
+        """Fetch, trim and write the vendor files; returns their sizes."""
+        os.makedirs(os.path.join(self.output_dir, 'fonts'), exist_ok=True)
+        upstream = {name: self._fetch(name, url, source) for name, url in SOURCES.items()}
+        used = self._used_tokens(self._template_sources() + self._script_sources())
+        used |= set(self.app.config['VENDOR_EXTRA_CLASSES'])
+        shell_used = self._used_tokens([self._read_template('base.html')])
+
+        bootstrap = parse_css(upstream['bootstrap.min.css'].decode('utf-8'))
+        icons = parse_css(upstream['all.min.css'].decode('utf-8'))
+        fonts = {stem for stem, classes in FONT_FILES.items() if used & set(classes)}
+        icons = [node for node in purge_css(icons, used)
+                 if not _is_font_face(node) or _font_stem(node) in fonts]
+        icons = [_rewrite_font_src(node) if _is_font_face(node) else node for node in icons]
+
+        licenses = LICENSE_RE.findall(upstream['bootstrap.min.css'].decode('utf-8'))
+        licenses += LICENSE_RE.findall(upstream['all.min.css'].decode('utf-8'))
+        vendor_css = '\n'.join(licenses) + '\n' + serialize_css(drop_unused_keyframes(
+            purge_css(bootstrap, used | BOOTSTRAP_SAFELIST) + icons))
+        critical_css = serialize_css(drop_unused_keyframes(critical_nodes(purge_css(bootstrap, shell_used))))
+
+        self._write('vendor.css', vendor_css.encode('utf-8'))
+        self._write('critical.css', critical_css.encode('utf-8'))
+        self._write('bootstrap.bundle.min.js', upstream['bootstrap.bundle.min.js'])
+        codepoints = {int(cp, 16) for cp in CODEPOINT_RE.findall(serialize_css(icons))}
+        for stem in fonts:
+            data = self._fetch(f'webfonts/{stem}.woff2', f'{FONT_AWESOME_CDN}/webfonts/{stem}.woff2', source)
+            self._write(f'fonts/{stem}.woff2', subset_font(data, codepoints))
+        return {name: os.path.getsize(os.path.join(self.output_dir, name))
+                for name in ['vendor.css', 'critical.css', 'bootstrap.bundle.min.js']
+                + [f'fonts/{stem}.woff2' for stem in sorted(fonts)]}
+
+    def _fetch(self, name, url, source):
+        if source:
+            with open(os.path.join(source, name), 'rb') as f:
+                return f.read()
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.read()
+
+    def _write(self, name, data):
+        with open(os.path.join(self.output_dir, name), 'wb') as f:
+            f.write(data)
+
+    def _read_template(self, name):
+        env = self.app.jinja_env
+        return env.loader.get_source(env, name)[0]
+
+    def _template_sources(self):
+        return [self._read_template(name) for name in self.app.jinja_env.list_templates()]
+
+    def _script_sources(self):
+        sources = []
+        for root, dirs, files in os.walk(self.app.static_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.output_dir]
+            for name in files:
+                if name.endswith('.js'):
+                    with open(os.path.join(root, name), encoding='utf-8') as f:
+                        sources.append(f.read())
+        return sources
+
+    @staticmethod
+    def _used_tokens(sources):
+        """Every word that could be a class name, PurgeCSS style.
+
+        ``alert-{{ 'a' if x else 'b' }}`` in a template, or ``alert-${x ? 'a' : 'b'}``
+        in a script, yields ``alert-a`` and ``alert-b``.
+        """
+        tokens = set()
+        for text in sources:
+            tokens.update(TOKEN_RE.findall(text))
+            for prefix, jinja, script in DYNAMIC_CLASS_RE.findall(text):
+                tokens.update(prefix + name for name in QUOTED_RE.findall(jinja or script))
+        return tokens
+
+
+def parse_css(text):
+    """Parse minified CSS into ``(kind, prelude, body)`` nodes.
+
+    ``kind`` is ``'rule'`` (body is the raw declaration text), ``'group'``
+    (body is a list of child nodes) or ``'stmt'`` (``@import`` and friends).
+    """
+    nodes, _ = _parse_block(COMMENT_RE.sub('', text), 0)
+    return nodes
+
+
+def serialize_css(nodes):
+    out = []
+    for kind, prelude, body in nodes:
+        if kind == 'stmt':
+            out.append(prelude + ';')
+        elif kind == 'group':
+            out.append(prelude + '{' + serialize_css(body) + '}')
+        else:
+            out.append(prelude + '{' + body + '}')
+    return ''.join(out)
+
+
+def purge_css(nodes, used):
+    """Drop selectors whose classes or ids never appear in ``used``."""
+    kept = []
+    for kind, prelude, body in nodes:
+        if kind == 'group':
+            children = purge_css(body, used)
+            if children:
+                kept.append((kind, prelude, children))
+        elif kind == 'rule' and not prelude.startswith('@'):
+            selectors = [s for s in _split_selectors(prelude) if _selector_used(s, used)]
+            if selectors:
+                kept.append((kind, ','.join(selectors), body))
+        else:
+            kept.append((kind, prelude, body))
+    return kept
+
+
+def critical_nodes(nodes):
+    """Plain rules and the ``@media`` groups holding them; other at-rules wait for the full stylesheet."""
+    kept = []
+    for kind, prelude, body in nodes:
+        if kind == 'group' and prelude.lower().startswith('@media'):
+            children = critical_nodes(body)
+            if children:
+                kept.append((kind, prelude, children))
+        elif not prelude.startswith('@'):
+            kept.append((kind, prelude, body))
+    return kept
+
+
+def drop_unused_keyframes(nodes):
+    referenced = serialize_css([n for n in _walk(nodes) if not _is_keyframes(n)])
+
+    def keep(node):
+        if not _is_keyframes(node):
+            return True
+        return re.search(r'\b' + re.escape(KEYFRAMES_RE.match(node[1]).group(1)) + r'\b', referenced)
+
+    def filter_nodes(items):
+        result = []
+        for kind, prelude, body in items:
+            if kind == 'group':
+                body = filter_nodes(body)
+                if not body:
+                    continue
+            elif not keep((kind, prelude, body)):
+                continue
+            result.append((kind, prelude, body))
+        return result
+    return filter_nodes(nodes)
+
+
+def subset_font(data, codepoints):
+    """Keep only ``codepoints`` in a woff2 font when fonttools is installed."""
+    if font_subset is None or not codepoints:
+        return data
+    options = font_subset.Options()
+    options.flavor = 'woff2'
+    try:
+        font = font_subset.load_font(io.BytesIO(data), options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font_subset.save_font(font, out, options)
+    except Exception:  # woff2 output needs brotli; fall back to the full font
+        return data
+    return out.getvalue()
+
+
+def _parse_block(text, pos):
+    nodes = []
+    length = len(text)
+    while pos < length:
+        while pos < length and text[pos].isspace():
+            pos += 1
+        if pos >= length:
+            break
+        if text[pos] == '}':
+            return nodes, pos + 1
+        start = pos
+        pos = _scan(text, pos, '{;}')
+        prelude = text[start:pos].strip()
+        if pos >= length or text[pos] == '}':
+            continue
+        if text[pos] == ';':
+            nodes.append(('stmt', prelude, None))
+            pos += 1
+        elif prelude.lower().startswith(NESTED_AT_RULES):
+            children, pos = _parse_block(text, pos + 1)
+            nodes.append(('group', prelude, children))
+        else:
+            end = _block_end(text, pos + 1)
+            nodes.append(('rule', prelude, text[pos + 1:end]))
+            pos = end + 1
+    return nodes, pos
+
+
+def _scan(text, pos, stops):
+    quote = None
+    while pos < len(text):
+        char = text[pos]
+        if quote:
+            if char == '\\':
+                pos += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in stops:
+            return pos
+        pos += 1
+    return pos
+
+
+def _block_end(text, pos):
+    depth = 0
+    while pos < len(text):
+        pos = _scan(text, pos, '{}')
+        if pos >= len(text) or (text[pos] == '}' and depth == 0):
+            return pos
+        depth += 1 if text[pos] == '{' else -1
+        pos += 1
+    return pos
+
+
+def _split_selectors(prelude):
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(prelude[start:i])
+            start = i + 1
+    parts.append(prelude[start:])
+    return [part.strip() for part in parts]
+
+
+def _selector_used(selector, used):
+    names = CLASS_RE.findall(PSEUDO_FUNCTION_RE.sub('', re.sub(r'\[[^\]]*\]', '', selector)))
+    return all(name.replace('\\', '') in used for name in names)
+
+
+def _walk(nodes):
+    for node in nodes:
+        if node[0] == 'group':
+            yield from _walk(node[2])
+        else:
+            yield node
+
+
+def _is_keyframes(node):
+    return node[0] == 'rule' and KEYFRAMES_RE.match(node[1]) is not None
+
+
+def _is_font_face(node):
+    return node[0] == 'rule' and node[1] == '@font-face'
+
+
+def _font_stem(node):
+    match = FONT_URL_RE.search(node[2])
+    if match is None or 'Font Awesome 6' not in node[2]:
+        return None
+    return match.group(1)
+
+
+def _rewrite_font_src(node):
+    body = re.sub(r'src:[^;}]+', f'src:url(fonts/{_font_stem(node)}.woff2) format("woff2")', node[2])
+    return (node[0], node[1], body)
+"""In-memory product catalog with lookups by category, slug and spec attribute."""
+import re
+from collections import defaultdict
+from typing import NamedTuple
+
+
+class Category(NamedTuple):
+    slug: str
+    title: str
+    icon: str
+
+
+class Product(NamedTuple):
+    slug: str
+    category: str
+    name: str
+    summary: str
+    specs: tuple  # ((label, value), ...) in display order
+
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def spec_key(label):
+    """Normalise a spec label ('Load capacity') to an index key ('load_capacity')."""
+    return slugify(label).replace('-', '_')
+
+
+class Catalog:
+    """Immutable catalog built once; every lookup is a dict access."""
+
+    def __init__(self, categories, products):
+        self.categories = tuple(categories)
+        self.products = tuple(products)
+        self._categories = {category.slug: category for category in self.categories}
+        self._by_slug = {product.slug: product for product in self.products}
+        by_category = defaultdict(list)
+        by_spec = defaultdict(list)
+        for product in self.products:
+            by_category[product.category].append(product)
+            for label, value in product.specs:
+                by_spec[spec_key(label)].append((product, value))
+        self._by_category = {slug: tuple(by_category[slug]) for slug in self._categories}
+        self._by_spec = {key: tuple(entries) for key, entries in by_spec.items()}
+
+    def __len__(self):
+        return len(self.products)
+
+    def category(self, slug):
+        return self._categories.get(slug)
+
+    def product(self, slug):
+        return self._by_slug.get(slug)
+
+    def in_category(self, slug):
+        return self._by_category.get(slug, ())
+
+    def spec_attributes(self):
+        return sorted(self._by_spec)
+
+    def with_spec(self, attribute):
+        """``(product, value)`` pairs for every product listing ``attribute``."""
+        return self._by_spec.get(spec_key(attribute), ())
+
+
+def _product(category, name, summary, *specs):
+    return Product(slugify(name), category, name, summary,
+                   tuple(tuple(spec.split(': ', 1)) for spec in specs))
+
+
+CATEGORIES = (
+    Category('structural', 'Structural Load & Response Testing', 'fa-weight-hanging'),
+    Category('ndt', 'Structural Sensing & NDT Tools', 'fa-search'),
+    Category('geotechnical', 'Geotechnical & Foundation Testing', 'fa-layer-group'),
+)
+
+PRODUCTS = (
+    _product('structural', 'Hydraulic Load Frames',
+             'High-capacity testing frames for static and dynamic load applications.',
+             'Capacity: 50kN to 5000kN', 'Precision: ±0.5% of reading',
+             'Control: Digital servo-hydraulic', 'Data: Real-time acquisition'),
+    _product('structural', 'Actuator Systems',
+             'Precision actuators for multi-axis testing and complex loading scenarios.',
+             'Force: Up to 2500kN', 'Stroke: 100mm to 1000mm',
+             'Frequency: 0.01 to 50 Hz', 'Control: Multi-channel coordination'),
+    _product('structural', 'Static Load Testing Rigs',
+             'Customizable rigs for beam, column, and slab testing applications.',
+             'Configuration: Modular design', 'Span: Up to 12 meters',
+             'Loading: Point, distributed, cyclic', 'Standards: ASTM, ISO, EN compliant'),
+    _product('structural', 'Dynamic Shakers & Vibration Tables',
+             'Seismic simulation and dynamic response testing equipment.',
+             'Force: 10N to 50kN', 'Frequency: DC to 2000 Hz',
+             'Acceleration: Up to 100g', 'Control: Random, sine, shock'),
+    _product('ndt', 'Digital Strain Gauge Systems',
+             'High-precision strain measurement with wireless capabilities.',
+             'Resolution: 1 microstrain', 'Channels: Up to 128 per unit',
+             'Range: ±50,000 microstrain', 'Sampling: Up to 10 kHz'),
+    _product('ndt', 'Ultrasonic Pulse Velocity Testers',
+             'Non-destructive concrete quality assessment and defect detection.',
+             'Frequency: 54 kHz standard', 'Resolution: 0.1 μs',
+             'Range: 0.1 to 6553.5 μs', 'Memory: 250 readings storage'),
+    _product('ndt', 'Ground Penetrating Radar',
+             'Subsurface investigation and reinforcement detection systems.',
+             'Frequency: 100 MHz to 2.6 GHz', 'Depth: Up to 3 meters in concrete',
+             'Resolution: Sub-centimeter', 'Display: Real-time imaging'),
+    _product('ndt', 'Infrared Thermography Cameras',
+             'Thermal imaging for defect detection and energy audits.',
+             'Resolution: 640 x 480 pixels', 'Temperature: -40°C to +1200°C',
+             'Accuracy: ±2°C or ±2%', 'Analysis: Advanced software suite'),
+    _product('geotechnical', 'Plate Load Test Systems',
+             'In-situ bearing capacity and settlement testing equipment.',
+             'Plate sizes: 300mm to 762mm', 'Load capacity: Up to 5000kN',
+             'Settlement: 0.01mm resolution', 'Standards: ASTM D1196, IS 1888'),
+    _product('geotechnical', 'Piezocone Penetrometer Test',
+             'Advanced CPT systems for soil characterization and profiling.',
+             'Capacity: 200kN push force', 'Depth: Up to 100 meters',
+             'Parameters: qc, fs, u, inclination', 'Rate: 20mm/second standard'),
+    _product('geotechnical', 'Vane Shear Testers',
+             'In-situ shear strength measurement for cohesive soils.',
+             'Vane sizes: 33mm to 130mm', 'Torque: Up to 980 N·m',
+             'Rotation: 6°/minute standard', 'Display: Digital readout'),
+    _product('geotechnical', 'Pressuremeters',
+             'Lateral pressure testing for deformation modulus determination.',
+             'Pressure: Up to 5 MPa', 'Volume: 535 cm³ capacity',
+             'Depth: Up to 50 meters', 'Control: Automatic pressure regulation'),
+)
+
+catalog = Catalog(CATEGORIES, PRODUCTS)
+"""Numeric spec parsing and a bitset interval index for faceted product search."""
+import math
+import re
+from bisect import bisect_left, bisect_right
+
+from catalog import spec_key
+
+# unit -> (dimension, factor to the dimension's base unit)
+UNITS = {
+    'N': ('force', 1.0), 'kN': ('force', 1e3), 'MN': ('force', 1e6),
+    'mm': ('length', 1e-3), 'cm': ('length', 1e-2), 'm': ('length', 1.0),
+    'meter': ('length', 1.0), 'meters': ('length', 1.0),
+    'Hz': ('frequency', 1.0), 'kHz': ('frequency', 1e3), 'MHz': ('frequency', 1e6), 'GHz': ('frequency', 1e9),
+    'g': ('acceleration', 9.80665), 'm/s²': ('acceleration', 1.0),
+    'μs': ('time', 1e-6), 'us': ('time', 1e-6), 'ms': ('time', 1e-3), 's': ('time', 1.0),
+    'Pa': ('pressure', 1.0), 'kPa': ('pressure', 1e3), 'MPa': ('pressure', 1e6),
+    '°C': ('temperature', 1.0), '%': ('percent', 1.0),
+    'cm³': ('volume', 1e-6), 'm³': ('volume', 1.0),
+    'N·m': ('torque', 1.0), 'kN·m': ('torque', 1e3),
+    'microstrain': ('strain', 1e-6),
+    'mm/second': ('velocity', 1e-3), 'mm/s': ('velocity', 1e-3), 'm/s': ('velocity', 1.0),
+}
+COUNT = 'count'
+# Facets over a whole dimension are named 'dim:force', apart from spec labels
+# such as 'frequency' that are also dimension names
+DIMENSION_PREFIX = 'dim:'
+
+_UNIT_PATTERN = '|'.join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+_NUMBER = r'[+-]?\d[\d,]*(?:\.\d+)?'
+_QUANTITY_RE = re.compile(rf'\s*(?P<number>{_NUMBER})\s*(?P<unit>{_UNIT_PATTERN})?(?=$|[\s,;)])')
+
+
+def parse_quantity(text, pos=0):
+    """Parse ``'50kN'`` at ``pos`` into ``(value_in_base_unit, dimension, end)``.
+
+    Returns ``None`` when there is no number there or it is followed by an
+    unknown unit (``'6°/minute'``) or a dimension separator (``'640 x 480'``).
+    """
+    match = _QUANTITY_RE.match(text, pos)
+    if match is None or re.match(r'\s*[x×]\s*\d', text[match.end():]):
+        return None
+    dimension, factor = UNITS.get(match.group('unit'), (COUNT, 1.0))
+    return float(match.group('number').replace(',', '')) * factor, dimension, match.end()
+
+
+def parse_range(text):
+    """Parse a spec value into ``(low, high, dimension)`` in base units.
+
+    Understands ``'50kN to 5000kN'``, ``'0.01 to 50 Hz'``, ``'Up to 2500kN'``,
+    ``'DC to 2000 Hz'``, ``'±50,000 microstrain'`` and single values such as
+    ``'54 kHz standard'``. Returns ``None`` for text without a usable number.
+    """
+    text = text.strip()
+    lower = text.lower()
+    if lower.startswith('up to '):
+        quantity = parse_quantity(text, 6)
+        return quantity and (0.0, quantity[0], quantity[1])
+    if lower.startswith('dc to '):
+        quantity = parse_quantity(text, 6)
+        return quantity and (0.0, quantity[0], quantity[1])
+    if text.startswith('±'):
+        quantity = parse_quantity(text, 1)
+        return quantity and (-abs(quantity[0]), abs(quantity[0]), quantity[1])
+    first = parse_quantity(text)
+    if first is None:
+        return None
+    low, dimension, end = first
+    to = re.match(r'\s+to\s+', text[end:])
+    if to is None:
+        return low, low, dimension
+    second = parse_quantity(text, end + to.end())
+    if second is None:
+        return None
+    high, high_dimension, _ = second
+    if dimension == COUNT and high_dimension != COUNT:
+        # '0.01 to 50 Hz': the trailing unit applies to both ends
+        low *= UNITS[_QUANTITY_RE.match(text, end + to.end()).group('unit')][1]
+        dimension = high_dimension
+    if dimension != high_dimension:
+        return None
+    return min(low, high), max(low, high), dimension
+
+
+def parse_query(text):
+    """Parse a search bound: ``'1000kN'``, ``'>=1000kN'``, ``'<=2000Hz'``, ``'1kN..5kN'``.
+
+    Returns ``(low, high, dimension)``; open ends are infinite. Raises
+    ``ValueError`` for anything else.
+    """
+    text = text.strip()
+    if text.startswith('>='):
+        low, dimension = _bound(text[2:])
+        return low, math.inf, dimension
+    if text.startswith('<='):
+        high, dimension = _bound(text[2:])
+        return -math.inf, high, dimension
+    if '..' in text:
+        left, right = text.split('..', 1)
+        low = _bound(left) if left.strip() else (-math.inf, None)
+        high = _bound(right) if right.strip() else (math.inf, None)
+        dimensions = {low[1], high[1]} - {None}
+        if len(dimensions) != 1:
+            raise ValueError(f"Bounds of {text!r} must use compatible units")
+        return low[0], high[0], dimensions.pop()
+    value, dimension = _bound(text)
+    return value, value, dimension
+
+
+def _bound(text):
+    quantity = parse_quantity(text.strip())
+    if quantity is None or quantity[2] != len(text.strip()):
+        raise ValueError(f"Cannot parse {text.strip()!r} as a quantity")
+    return quantity[0], quantity[1]
+
+
+class IntervalIndex:
+    """Static interval index answering overlap queries as bitsets of row ids.
+
+    An interval ``[lo, hi]`` overlaps ``[a, b]`` unless ``lo > b`` or
+    ``hi < a``; both of those sets are a contiguous run in the intervals
+    sorted by ``lo`` or by ``hi``. Bitmasks of those runs are precomputed every
+    ``BLOCK`` rows, so a query is two bisections, two mask lookups and a
+    patch of at most ``BLOCK - 1`` bits each.
+    """
+
+    BLOCK = 64
+
+    def __init__(self, entries):
+        entries = list(entries)  # (row_id, lo, hi), at most one per row
+        self.mask = 0
+        for row, _, _ in entries:
+            self.mask |= 1 << row
+        by_lo = sorted(entries, key=lambda e: e[1])
+        by_hi = sorted(entries, key=lambda e: e[2])
+        self._los = [e[1] for e in by_lo]
+        self._lo_rows = [e[0] for e in by_lo]
+        self._his = [e[2] for e in by_hi]
+        self._hi_rows = [e[0] for e in by_hi]
+        # _lo_suffix[k]: rows at lo-sorted positions >= k * BLOCK
+        self._lo_suffix = [0] * (len(entries) // self.BLOCK + 2)
+        for k in range(len(self._lo_suffix) - 2, -1, -1):
+            self._lo_suffix[k] = self._lo_suffix[k + 1] | _bits(self._lo_rows[k * self.BLOCK:(k + 1) * self.BLOCK])
+        # _hi_prefix[k]: rows at hi-sorted positions < k * BLOCK
+        self._hi_prefix = [0]
+        for k in range(0, len(entries), self.BLOCK):
+            self._hi_prefix.append(self._hi_prefix[-1] | _bits(self._hi_rows[k:k + self.BLOCK]))
+
+    def overlapping(self, low, high):
+        """Bitmask of rows whose interval overlaps ``[low, high]``."""
+        start = bisect_right(self._los, high)  # positions >= start have lo > high
+        block = -(-start // self.BLOCK)
+        above = self._lo_suffix[block] | _bits(self._lo_rows[start:block * self.BLOCK])
+        end = bisect_left(self._his, low)  # positions < end have hi < low
+        block = end // self.BLOCK
+        below = self._hi_prefix[block] | _bits(self._hi_rows[block * self.BLOCK:end])
+        return self.mask & ~above & ~below
+
+
+class SpecIndex:
+    """Interval indexes over every parseable numeric spec in a catalog.
+
+    Each spec attribute (``capacity``, ``frequency``…) gets an index per
+    dimension; each dimension gets one too, as the ``dim:force``,
+    ``dim:length``… facet, holding the hull of every spec a product has in
+    that dimension. Filters combine as bitwise ANDs over product row ids.
+    """
+
+    def __init__(self, catalog):
+        self.products = list(catalog.products)
+        self.all = (1 << len(self.products)) - 1
+        self._categories = {}
+        intervals = {}
+        for row, product in enumerate(self.products):
+            self._categories[product.category] = self._categories.get(product.category, 0) | 1 << row
+            for label, value in product.specs:
+                parsed = parse_range(value)
+                if parsed is None:
+                    continue
+                low, high, dimension = parsed
+                for key in ((spec_key(label), dimension), (DIMENSION_PREFIX + dimension, dimension)):
+                    current = intervals.setdefault(key, {}).get(row)
+                    if current is not None:
+                        low, high = min(low, current[0]), max(high, current[1])
+                    intervals[key][row] = (low, high)
+        self._indexes = {key: IntervalIndex((row, lo, hi) for row, (lo, hi) in rows.items())
+                         for key, rows in intervals.items()}
+        self.facets = sorted({key for key, _ in self._indexes})
+
+    def dimensions(self, facet):
+        return sorted(dimension for key, dimension in self._indexes if key == facet)
+
+    def search(self, filters, category=None):
+        """Return the bitmask of products matching every ``facet -> query`` filter.
+
+        Raises ``KeyError`` for an unknown facet and ``ValueError`` for an
+        unparseable or dimensionally incompatible query.
+        """
+        result = self.all
+        if category is not None:
+            result &= self._categories.get(category, 0)
+        for facet, query in filters.items():
+            low, high, dimension = parse_query(query)
+            dimensions = self.dimensions(facet)
+            if not dimensions:
+                raise KeyError(facet)
+            if dimension == COUNT and COUNT not in dimensions:
+                raise ValueError(f"{facet} needs a unit ({', '.join(dimensions)})")
+            if dimension not in dimensions:
+                raise ValueError(f"{facet} is measured in {', '.join(dimensions)}, not {dimension}")
+            result &= self._indexes[(facet, dimension)].overlapping(low, high)
+        return result
+
+    def category_counts(self, mask):
+        return {slug: (mask & bits).bit_count() for slug, bits in self._categories.items()}
+
+    def rows(self, mask, limit):
+        """Products for the lowest ``limit`` set bits of ``mask``."""
+        found = []
+        while mask and len(found) < limit:
+            low_bit = mask & -mask
+            found.append(self.products[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return found
+
+
+def _bits(rows):
+    mask = 0
+    for row in rows:
+        mask |= 1 << row
+    return mask
+"""Production launcher: preloaded gunicorn workers configured from the environment."""
+import multiprocessing
+import os
+
+# Workers share rate-limit buckets through a memory-mapped table
+os.environ.setdefault("RATELIMIT_BACKEND", "shared")
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def server_options():
+    """Gunicorn settings, each overridable through an environment variable."""
+    return {
+        'bind': f"{os.environ.get('HOST', '0.0.0.0')}:{_env_int('PORT', 5000)}",
+        'workers': _env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1),
+        'worker_class': os.environ.get('WEB_WORKER_CLASS', 'gthread'),
+        'threads': _env_int('WEB_THREADS', 4),
+        'timeout': _env_int('WEB_TIMEOUT', 30),
+        'graceful_timeout': _env_int('WEB_GRACEFUL_TIMEOUT', 30),
+        'keepalive': _env_int('WEB_KEEPALIVE', 5),
+        'max_requests': _env_int('WEB_MAX_REQUESTS', 0),
+        'max_requests_jitter': _env_int('WEB_MAX_REQUESTS_JITTER', 0),
+        'backlog': _env_int('WEB_BACKLOG', 2048),
+        'preload_app': True,
+        'accesslog': os.environ.get('WEB_ACCESS_LOG') or None,
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+    }
+
+
+def on_starting(server):
+    """Build the compressed static files and drop the previous run's metrics files before any worker starts."""
+    import app as app_module
+
+    app_module.compress.prepare_static(build=True)
+    app_module.metrics.clear_files()
+
+
+def post_fork(server, worker):
+    """Start the per-process background services in a freshly forked worker.
+
+    Importing the app never starts them, so the master that preloads it before
+    forking holds no threads or SQLite connections.
+    """
+    import app as app_module
+
+    app_module.start_background_services()
+
+
+def main():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("The production server needs gunicorn: pip install gunicorn")
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in server_options().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
+"""Token-bucket rate limiting for the form endpoints."""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, request, session
+from werkzeug.exceptions import TooManyRequests
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; only the memory backend works there
+    fcntl = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(text):
+    """``'5/minute'`` or ``'30/2hour'`` -> ``(capacity, tokens_per_second)``."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*', text)
+    if match is None:
+        raise ValueError(f"Invalid rate {text!r}; expected e.g. '5/minute'")
+    capacity = int(match.group(1))
+    period = int(match.group(2) or 1) * PERIODS[match.group(3)]
+    return capacity, capacity / period
+
+
+def _refill(tokens, last, now, capacity, rate):
+    return min(capacity, tokens + (now - last) * rate)
+
+
+class MemoryBackend:
+    """Buckets in a dict; correct for a single process."""
+
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, last, now, capacity, rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        # Drop the least recently touched half; a missing bucket starts full
+        cutoff = sorted(last for _, last in self._buckets.values())[len(self._buckets) // 2]
+        self._buckets = {k: v for k, v in self._buckets.items() if v[1] > cutoff}
+
+
+class SharedMemoryBackend:
+    """Buckets in a memory-mapped hash table shared by every worker process.
+
+    Each slot holds a 64-bit key hash, the token count and the last update
+    time. A key probes ``PROBES`` consecutive slots; the probe window is
+    guarded by a byte-range ``fcntl`` lock (between processes) plus a
+    thread lock (within one). When the window is full the least recently
+    used slot is recycled, which at worst hands that client a full bucket.
+    """
+
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path, slots=65536):
+        if fcntl is None:
+            raise RuntimeError("The shared rate-limit backend needs fcntl (POSIX)")
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        start = digest % (self.slots - self.PROBES + 1)
+        offset = start * self.SLOT.size
+        length = self.PROBES * self.SLOT.size
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                slot = self._find_slot(digest, offset)
+                stored, tokens, last = self.SLOT.unpack_from(self._map, slot)
+                if stored != digest:
+                    tokens, last = capacity, now
+                tokens = _refill(tokens, last, now, capacity, rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.SLOT.pack_into(self._map, slot, digest, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+        return allowed, tokens
+
+    def _find_slot(self, digest, offset):
+        oldest, oldest_time = offset, math.inf
+        for i in range(self.PROBES):
+            slot = offset + i * self.SLOT.size
+            stored, _, last = self.SLOT.unpack_from(self._map, slot)
+            if stored == digest or stored == 0:
+                return slot
+            if last < oldest_time:
+                oldest, oldest_time = slot, last
+        return oldest
+
+
+class RateLimiter:
+    """Throttle views per client IP and per session with token buckets.
+
+    ``@limiter.limit('forms')`` checks the ``RATELIMIT_<SCOPE>_PER_IP`` and
+    ``RATELIMIT_<SCOPE>_PER_SESSION`` rates before the view runs, and raises
+    ``429 Too Many Requests`` with ``Retry-After`` once either is exhausted.
+    The session bucket is keyed on the session's CSRF secret, or on the
+    stateless CSRF cookie, so clients with neither are only limited by IP.
+    """
+
+    def __init__(self, app=None):
+        self.allowed = Counter()
+        self.limited = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_SHARED_PATH', _default_shared_path(app))
+        app.extensions['ratelimit'] = self
+        if app.config['RATELIMIT_BACKEND'] == 'shared':
+            self.backend = SharedMemoryBackend(app.config['RATELIMIT_SHARED_PATH'])
+        else:
+            self.backend = MemoryBackend()
+
+    def limit(self, scope):
+        rules = []
+        for kind in ('ip', 'session'):
+            rate = self.app.config.get(f'RATELIMIT_{scope.upper()}_PER_{kind.upper()}')
+            if rate:
+                rules.append((kind, *parse_rate(rate)))
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.app.config['RATELIMIT_ENABLED']:
+                    self.check(scope, rules)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def check(self, scope, rules):
+        now = time.monotonic()
+        for kind, capacity, rate in rules:
+            identity = self._identity(kind)
+            if identity is None:
+                continue
+            allowed, tokens = self.backend.take(f'{scope}:{kind}:{identity}', capacity, rate, now)
+            if not allowed:
+                self.limited[(scope, kind)] += 1
+                raise TooManyRequests(retry_after=math.ceil((1 - tokens) / rate))
+        self.allowed[scope] += 1
+
+    def stats(self):
+        return {
+            'allowed': dict(self.allowed),
+            'limited': {f'{scope}:{kind}': count for (scope, kind), count in self.limited.items()},
+        }
+
+    @staticmethod
+    def _identity(kind):
+        if kind == 'ip':
+            return request.remote_addr
+        secret = session.get('csrf_token') or request.cookies.get(current_app.config.get('CSRF_COOKIE_NAME'))
+        return hashlib.sha1(secret.encode()).hexdigest() if secret else None
+
+
+def _default_shared_path(app):
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/civiltech-ratelimit'
+    return os.path.join(app.instance_path, 'ratelimit.shm')
+"""Cheap pre-validation checks that turn away obvious bot submissions."""
+import hashlib
+import math
+import re
+from collections import Counter
+from functools import wraps
+
+from flask import flash, jsonify, redirect, request
+from itsdangerous import BadSignature, SignatureExpired, TimestampSigner
+from markupsafe import Markup
+
+LINK_PATTERN = re.compile(r'https?://|www\.|\[url|<a\s', re.IGNORECASE)
+HOST_PATTERN = re.compile(r'(?:https?://|www\.)([a-z0-9.-]+)', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'[a-z0-9][a-z0-9-]{2,}')
+
+# Seed list; SPAM_BLOCKLIST_PATH adds to it (one token or domain per line)
+DEFAULT_BLOCKLIST = (
+    'viagra', 'cialis', 'casino', 'backlinks', 'porn', 'xxx', 'escort',
+    'payday', 'forex', 'seo-services',
+)
+
+REJECTED_MESSAGE = 'Your submission could not be accepted. Please try again.'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized from the expected number of entries and the false-positive rate;
+    positions come from one blake2b digest split into two hashes
+    (Kirsch-Mitzenmacher double hashing).
+    """
+
+    def __init__(self, capacity, error_rate=1e-5):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_tokens(cls, tokens, error_rate=1e-5):
+        tokens = set(tokens)
+        bloom = cls(len(tokens), error_rate)
+        for token in tokens:
+            bloom.add(token)
+        return bloom
+
+    def _positions(self, token):
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, token):
+        for pos in self._positions(token):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, token):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(token))
+
+
+class SpamFilter:
+    """Reject junk form posts before any form object is built.
+
+    ``@spam_filter.screen`` runs, cheapest first: a honeypot field that
+    humans never see, a signed render timestamp enforcing a minimum
+    time-to-submit, a link count over the free-text fields and a Bloom
+    filter of known-bad words and domains. Render stamps older than
+    ``SPAM_MAX_FORM_AGE`` (the CSRF token lifetime by default) are refused,
+    so a harvested stamp cannot be replayed. Templates emit the hidden
+    fields with ``{{ spam_trap() }}``. Rejections are counted per reason
+    and the visitor is sent back to the form with a generic message.
+    """
+
+    def __init__(self, app=None):
+        self.passed = Counter()
+        self.rejected = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('SPAM_FILTER_ENABLED', True)
+        app.config.setdefault('SPAM_HONEYPOT_FIELD', 'homepage_url')
+        app.config.setdefault('SPAM_MIN_SUBMIT_SECONDS', 3)
+        app.config.setdefault('SPAM_MAX_FORM_AGE', app.config.get('WTF_CSRF_TIME_LIMIT') or 3600)
+        app.config.setdefault('SPAM_MAX_LINKS', 2)
+        app.config.setdefault('SPAM_TEXT_FIELDS', ('message', 'project_details'))
+        app.config.setdefault('SPAM_BLOCKLIST_PATH', None)
+        app.extensions['spam_filter'] = self
+        self.signer = TimestampSigner(app.secret_key, salt='spam-filter')
+        self.blocklist = BloomFilter.from_tokens(self._load_blocklist(app.config['SPAM_BLOCKLIST_PATH']))
+        app.add_template_global(self.spam_trap)
+
+    @staticmethod
+    def _load_blocklist(path):
+        tokens = list(DEFAULT_BLOCKLIST)
+        if path:
+            with open(path, encoding='utf-8') as fh:
+                tokens.extend(line.strip().lower() for line in fh
+                              if line.strip() and not line.startswith('#'))
+        return tokens
+
+    def spam_trap(self):
+        """Hidden honeypot input plus the signed render time."""
+        field = self.app.config['SPAM_HONEYPOT_FIELD']
+        page_cache = self.app.extensions.get('page_cache')
+        stamp = page_cache.placeholder('form_rendered', self.stamp) if page_cache is not None else None
+        return Markup(
+            '<div style="position:absolute;left:-10000px" aria-hidden="true">'
+            f'<label for="{field}">Leave this field empty</label>'
+            f'<input type="text" id="{field}" name="{field}" tabindex="-1" autocomplete="off">'
+            '</div>'
+            f'<input type="hidden" name="form_rendered" value="{stamp or self.stamp()}">'
+        )
+
+    def stamp(self):
+        return self.signer.sign(b'form').decode()
+
+    def screen(self, view):
+        """Screen a page view; rejected posts are sent back to the form with a flash."""
+        def reject():
+            flash(REJECTED_MESSAGE, 'error')
+            return redirect(request.path, code=303)
+        return self._screen(view, reject)
+
+    def screen_json(self, view):
+        """Screen a JSON API view; rejected posts get a ``400`` with a message."""
+        return self._screen(view, lambda: (jsonify(ok=False, message=REJECTED_MESSAGE), 400))
+
+    def _screen(self, view, reject):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.app.config['SPAM_FILTER_ENABLED']:
+                reason = self.check(submitted_fields())
+                if reason is not None:
+                    self.rejected[(request.endpoint, reason)] += 1
+                    self.app.logger.info("Rejected form submission",
+                                         extra={'event': 'spam_rejected', 'fields': {'reason': reason}})
+                    return reject()
+                self.passed[request.endpoint] += 1
+            return view(*args, **kwargs)
+        return wrapper
+
+    def check(self, form):
+        """Return the first failing check's name, or ``None`` if *form* looks human."""
+        config = self.app.config
+        if form.get(config['SPAM_HONEYPOT_FIELD']):
+            return 'honeypot'
+        try:
+            _, rendered = self.signer.unsign(form.get('form_rendered', ''), return_timestamp=True,
+                                             max_age=config['SPAM_MAX_FORM_AGE'])
+        except SignatureExpired:
+            return 'expired'
+        except BadSignature:
+            return 'timestamp'
+        age = (self.signer.get_timestamp() - rendered.timestamp())
+        if age < config['SPAM_MIN_SUBMIT_SECONDS']:
+            return 'too_fast'
+        text = ' '.join(form.get(name, '') for name in config['SPAM_TEXT_FIELDS'])
+        if len(LINK_PATTERN.findall(text)) > config['SPAM_MAX_LINKS']:
+            return 'links'
+        lowered = text.lower()
+        tokens = set(WORD_PATTERN.findall(lowered))
+        tokens.update(host.removeprefix('www.') for host in HOST_PATTERN.findall(lowered))
+        if any(token in self.blocklist for token in tokens):
+            return 'blocklist'
+        return None
+
+    def stats(self):
+        return {
+            'passed': dict(self.passed),
+            'rejected': {f'{endpoint}:{reason}': count for (endpoint, reason), count in self.rejected.items()},
+        }
+
+
+def submitted_fields():
+    """The posted fields, from a form body or a JSON object."""
+    if not request.is_json:
+        return request.form
+    data = request.get_json(silent=True)
+    return {key: str(value) for key, value in data.items()} if isinstance(data, dict) else {}
+"""Per-endpoint request metrics in Prometheus text format, merged across workers."""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, abort, before_render_template, g, request, template_rendered
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+class MetricStore:
+    """Counters and histograms for one process, keyed by ``(name, labels)``.
+
+    ``labels`` is a tuple of ``(label, value)`` pairs. Histogram values
+    are ``[per-bucket counts..., sum, count]`` with non-cumulative buckets.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        hist = self.histograms.get((name, labels))
+        if hist is None:
+            hist = self.histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        hist[bisect.bisect_left(BUCKETS, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(hist)] for (name, labels), hist in self.histograms.items()],
+            }
+
+
+class Metrics:
+    """Time every request and serve the totals on ``/metrics``.
+
+    Each request records a count by endpoint, method and status, a total
+    latency histogram and a template render-time histogram (fed by Flask's
+    render signals, so page-cache hits show up as zero render time). Every
+    process periodically writes its totals to ``METRICS_DIR``; the
+    ``/metrics`` view sums those files with its own live numbers, so a
+    scrape sees all gunicorn workers, including ones that have exited.
+    """
+
+    def __init__(self, app=None):
+        self.store = MetricStore()
+        self.families = {}
+        self.collectors = []
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_NAMESPACE', 'civiltech')
+        app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.extensions['metrics'] = self
+        self.namespace = app.config['METRICS_NAMESPACE']
+        self._family('http_requests_total', 'counter', "Requests handled, by endpoint, method and status.")
+        self._family('http_request_duration_seconds', 'histogram', "Time from request start to response, by endpoint.")
+        self._family('template_render_seconds', 'histogram', "Time spent rendering templates per request, by endpoint.")
+        if not app.config['METRICS_ENABLED']:
+            return
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+        app.before_request(self._start_timer)
+        app.after_request(self._record)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _family(self, name, kind, help_text):
+        name = f'{self.namespace}_{name}'
+        self.families[name] = (kind, help_text)
+        return name
+
+    def register_counter(self, name, help_text, counter, labels):
+        """Export a ``Counter`` whose keys are label values (a string or a tuple)."""
+        self.collectors.append((self._family(name, 'counter', help_text), counter, labels))
+
+    def clear_files(self):
+        """Delete the totals written by a previous run (call once per launch, before forking)."""
+        for path in glob.glob(os.path.join(self.app.config['METRICS_DIR'], '*.json')):
+            os.remove(path)
+
+    def start(self):
+        """Start the flush thread for this process (call once per worker)."""
+        if not self.app.config['METRICS_ENABLED'] or self._thread is not None:
+            return
+        self._path = os.path.join(self.app.config['METRICS_DIR'], f'{os.getpid()}-{time.time_ns()}.json')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def _after_fork(self):
+        # Counts from before the fork (page-cache warming in the launcher)
+        # belong to the parent; every worker would otherwise export them again
+        self.store = MetricStore()
+        for _, counter, _ in self.collectors:
+            counter.clear()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.app.config['METRICS_FLUSH_INTERVAL']):
+            self.flush()
+
+    def flush(self):
+        tmp = f'{self._path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(self.collect(), fh)
+        os.replace(tmp, self._path)
+
+    def _start_timer(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_render = 0.0
+
+    def _render_started(self, sender, template, context, **extra):
+        g._metrics_render_start = time.perf_counter()
+
+    def _render_finished(self, sender, template, context, **extra):
+        start = g.pop('_metrics_render_start', None)
+        if start is not None:
+            g._metrics_render = g.get('_metrics_render', 0.0) + time.perf_counter() - start
+
+    def _record(self, response):
+        start = g.get('_metrics_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method if request.method in METHODS else 'OTHER'
+        labels = (('endpoint', endpoint),)
+        store = self.store
+        with store.lock:
+            store.counters[(f'{self.namespace}_http_requests_total',
+                            (('endpoint', endpoint), ('method', method), ('status', str(response.status_code))))] += 1
+            store.observe(f'{self.namespace}_http_request_duration_seconds', labels, elapsed)
+            store.observe(f'{self.namespace}_template_render_seconds', labels, g._metrics_render)
+        return response
+
+    def collect(self):
+        """This process's totals, including registered counters."""
+        snapshot = self.store.snapshot()
+        for name, counter, label_names in self.collectors:
+            for key, value in list(counter.items()):
+                values = key if isinstance(key, tuple) else (key,)
+                snapshot['counters'].append([name, tuple(zip(label_names, values)), value])
+        return snapshot
+
+    def aggregate(self):
+        """Sum the live totals with the files every other process has written."""
+        counters = defaultdict(float)
+        histograms = {}
+        snapshots = [self.collect()]
+        own = getattr(self, '_path', None)
+        for path in glob.glob(os.path.join(self.app.config['METRICS_DIR'], '*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError):
+                continue  # a worker is mid-write or just went away
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, hist in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(hist):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.aggregate()
+        lines = []
+        for name, (kind, help_text) in self.families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (series, labels), value in sorted(counters.items()):
+                    if series == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for (series, labels), hist in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), hist):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(hist[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {hist[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        token = self.app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(404)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+"""Offline load benchmark: per-route throughput and latency percentiles for the whole site.
+
+Starts ``serve.py`` on a free local port (or targets ``--url``), drives every
+page plus valid and invalid posts of both forms with real CSRF tokens, and
+writes the results to JSON so runs can be compared between commits. Latency
+is measured to the last byte, TTFB to the response headers::
+
+    python bench.py                              # -> bench-results/<commit>.json
+    python bench.py --compare bench-results/abc1234.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+Route = namedtuple('Route', 'name method path form payload expect')
+
+CONTACT = {
+    'name': 'Dana Whitfield',
+    'email': 'dana.whitfield@example.com',
+    'subject': 'Load frame quotation',
+    'message': 'We need a quote for a 500 kN load frame for our bridge materials lab.',
+}
+SERVICE = {
+    'company': 'Whitfield Structural',
+    'name': 'Dana Whitfield',
+    'email': 'dana.whitfield@example.com',
+    'phone': '305-555-0142',
+    'service_type': 'structural_testing',
+    'project_details': 'Static and cyclic load testing of precast deck panels, twelve specimens.',
+}
+
+ROUTES = (
+    Route('index', 'GET', '/', None, None, 200),
+    Route('products', 'GET', '/products', None, None, 200),
+    Route('product_category', 'GET', '/products/structural', None, None, 200),
+    Route('product_detail', 'GET', '/products/hydraulic-load-frames', None, None, 200),
+    Route('product_search', 'GET', '/api/products/search?capacity=%3E%3D100kN', None, None, 200),
+    Route('services', 'GET', '/services', None, None, 200),
+    Route('about', 'GET', '/about', None, None, 200),
+    Route('contact', 'GET', '/contact', None, None, 200),
+    Route('not_found', 'GET', '/no-such-page', None, None, 404),
+    Route('contact_post_valid', 'POST', '/contact', '/contact', CONTACT, 302),
+    Route('contact_post_invalid', 'POST', '/contact', '/contact', {**CONTACT, 'email': 'not-an-email'}, 200),
+    Route('services_post_valid', 'POST', '/services', '/services', SERVICE, 302),
+    Route('services_post_invalid', 'POST', '/services', '/services', {**SERVICE, 'service_type': ''}, 200),
+    Route('contact_api_valid', 'POST', '/api/contact', '/contact', CONTACT, 200),
+    Route('contact_api_invalid', 'POST', '/api/contact', '/contact', {**CONTACT, 'email': 'not-an-email'}, 422),
+    Route('services_api_valid', 'POST', '/api/services', '/services', SERVICE, 200),
+    Route('services_api_invalid', 'POST', '/api/services', '/services', {**SERVICE, 'service_type': ''}, 422),
+)
+
+HIDDEN_FIELD = re.compile(r'name="(csrf_token|form_rendered)"[^>]*value="([^"]+)"')
+
+# Settings for the server this script starts: no rate limiting or minimum
+# time-to-submit, quiet logs and a throwaway inquiry database
+SERVER_ENV = {
+    'HOST': '127.0.0.1',
+    'LOG_LEVEL': 'WARNING',
+    'RATELIMIT_BACKEND': 'memory',
+    'RATELIMIT_FORMS_PER_IP': '1000000/second',
+    'RATELIMIT_FORMS_PER_SESSION': '1000000/second',
+    'SPAM_MIN_SUBMIT_SECONDS': '0',
+}
+
+
+class Client:
+    """One keep-alive connection with its own session cookie."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.cookies = {}
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+
+    def request(self, method, path, body=None):
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            first_byte = time.perf_counter() - start
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.reconnect()
+            raise
+        if response.will_close:
+            self.reconnect()
+        return response, data, first_byte
+
+    def reconnect(self):
+        self.conn.close()
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def prime(self, form_path):
+        """Load a form page and return its CSRF token and render stamp."""
+        self.conn.request('GET', form_path)
+        response = self.conn.getresponse()
+        html = response.read().decode()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return dict(HIDDEN_FIELD.findall(html))
+
+
+def run_route(route, host, port, requests, concurrency, warmup):
+    """Drive *route* from *concurrency* threads and summarise the timings."""
+    latencies = []
+    first_bytes = []
+    statuses = Counter()
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(count):
+        client = Client(host, port)
+        body = None
+        if route.form:
+            body = urlencode({**route.payload, **client.prime(route.form)})
+        for _ in range(warmup):
+            try:
+                client.request(route.method, route.path, body)
+            except (OSError, http.client.HTTPException):
+                pass
+        local, local_ttfb, local_status, local_errors = [], [], Counter(), 0
+        ready.wait()
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                response, _, first_byte = client.request(route.method, route.path, body)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                continue
+            local.append(time.perf_counter() - start)
+            local_ttfb.append(first_byte)
+            local_status[response.status] += 1
+            if response.status != route.expect:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            first_bytes.extend(local_ttfb)
+            statuses.update(local_status)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_thread]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'method': route.method,
+        'path': route.path,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+        'rps': round(len(latencies) / elapsed, 1),
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        result.update(
+            mean_ms=round(statistics.fmean(latencies) * 1000, 3),
+            p50_ms=round(cuts[49] * 1000, 3),
+            p95_ms=round(cuts[94] * 1000, 3),
+            p99_ms=round(cuts[98] * 1000, 3),
+        )
+        cuts = statistics.quantiles(first_bytes, n=100, method='inclusive')
+        result.update(ttfb_p50_ms=round(cuts[49] * 1000, 3), ttfb_p95_ms=round(cuts[94] * 1000, 3))
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workdir):
+    env = {**os.environ, **SERVER_ENV, 'PORT': str(port),
+           'INQUIRY_DB_PATH': os.path.join(workdir, 'inquiries.db')}
+    server = subprocess.Popen([sys.executable, 'serve.py'], env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"serve.py exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit("serve.py did not start within 60 seconds")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(routes, baseline=None):
+    header = f"{'route':<24}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttfb p50':>10}{'errors':>8}"
+    if baseline:
+        header += f"{'Δ req/s':>10}{'Δ p95':>9}"
+    print(header)
+    for name, r in routes.items():
+        line = (f"{name:<24}{r['rps']:>9.1f}{r.get('p50_ms', 0):>9.2f}"
+                f"{r.get('p95_ms', 0):>9.2f}{r.get('p99_ms', 0):>9.2f}{r.get('ttfb_p50_ms', 0):>10.2f}{r['errors']:>8}")
+        old = (baseline or {}).get(name)
+        if old:
+            line += f"{_change(r['rps'], old['rps']):>10}{_change(r.get('p95_ms'), old.get('p95_ms')):>9}"
+        print(line)
+
+
+def _change(new, old):
+    if not new or not old:
+        return '-'
+    return f'{(new - old) / old:+.1%}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="Benchmark a running server instead of starting serve.py "
+                                      "(it should allow fast, repeated form posts)")
+    parser.add_argument('-n', '--requests', type=int, default=2000, help="Timed requests per route")
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help="Concurrent connections")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed requests per connection first")
+    parser.add_argument('--routes', help="Comma-separated subset of route names")
+    parser.add_argument('-o', '--output', help="Result file (default bench-results/<commit>.json)")
+    parser.add_argument('--compare', help="Earlier result file to show changes against")
+    args = parser.parse_args(argv)
+
+    routes = ROUTES
+    if args.routes:
+        wanted = set(args.routes.split(','))
+        unknown = wanted - {route.name for route in ROUTES}
+        if unknown:
+            parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+        routes = [route for route in ROUTES if route.name in wanted]
+
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            host, port = '127.0.0.1', free_port()
+            server = start_server(port, workdir)
+        try:
+            results = {route.name: run_route(route, host, port, args.requests, args.concurrency, args.warmup)
+                       for route in routes}
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'target': args.url or 'serve.py',
+        'workers': os.environ.get('WEB_CONCURRENCY'),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'routes': results,
+    }
+    output = args.output or os.path.join('bench-results', f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['routes']
+    print_table(results, baseline)
+    print(f"\nSaved {output}")
+    return 1 if any(r['errors'] for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+"""Chunked template responses that send the document head before the body is rendered."""
+from flask import Response, g, render_template, stream_template
+from markupsafe import Markup
+
+from page_cache import flashes_pending
+
+# Emitted by {{ stream_flush() }} while streaming; never reaches the client
+FLUSH_MARKER = '\x00stream-flush\x00'
+
+
+class TemplateStreamer:
+    """Opt-in streaming for long pages.
+
+    ``streamer.render(name, **context)`` behaves like ``render_template``
+    unless ``STREAM_TEMPLATES`` is on, in which case the page is sent with
+    chunked encoding while Jinja is still generating it. Output is held
+    back until a ``{{ stream_flush() }}`` in the template (``base.html``
+    places one after the navbar) and is otherwise coalesced into chunks of
+    at least ``STREAM_MIN_CHUNK`` bytes, so compression and the socket see
+    a few sizeable writes rather than one per template node.
+
+    Pages with flashed messages pending are rendered normally: the flashes
+    are consumed during rendering, and a streamed body is generated after
+    the session cookie has been sent, so they would never be cleared.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('STREAM_TEMPLATES', False)
+        app.config.setdefault('STREAM_MIN_CHUNK', 8192)
+        app.extensions['template_streamer'] = self
+        app.add_template_global(self.stream_flush)
+
+    @staticmethod
+    def stream_flush():
+        """Mark a point where everything rendered so far should be sent."""
+        return Markup(FLUSH_MARKER) if g.get('_streaming') else ''
+
+    def render(self, template_name, **context):
+        if not self.app.config['STREAM_TEMPLATES'] or flashes_pending():
+            return render_template(template_name, **context)
+        g._streaming = True
+        chunks = stream_template(template_name, **context)
+        return Response(self._coalesce(chunks, self.app.config['STREAM_MIN_CHUNK']), mimetype='text/html')
+
+    @staticmethod
+    def _coalesce(chunks, min_size):
+        buffer, size = [], 0
+        for chunk in chunks:
+            if FLUSH_MARKER in chunk:
+                *flushed, chunk = chunk.split(FLUSH_MARKER)
+                buffer.extend(flushed)
+                if any(buffer):
+                    yield ''.join(buffer)
+                buffer, size = [], 0
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+"""A ``{% cache %}`` Jinja tag that memoises rendered layout fragments."""
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache 'navbar', request.endpoint %}...{% endcache %}``
+
+    The first argument names the fragment, the rest are the variant key:
+    the body is rendered once per distinct key and then reused. Anything
+    else the body depends on must be constant for the life of the process.
+    The key also carries a hash of the body's source, so editing the
+    fragment never serves the old markup.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        version = hashlib.sha1(f'{parser.name}:{body!r}'.encode()).hexdigest()[:12]
+        call = self.call_method('_render_fragment', [nodes.Const(version), nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, version, key, caller):
+        cache = getattr(self.environment, 'fragment_cache', None)
+        if cache is None:
+            return caller()
+        return cache.fetch((version, *key), caller)
+
+
+class FragmentCache:
+    """Bounded LRU store behind the ``{% cache %}`` tag.
+
+    ``FRAGMENT_CACHE_SIZE`` caps the number of stored fragments; the least
+    recently used one is evicted first. Hits and misses are counted in
+    ``requests`` for the metrics endpoint.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 256)
+        app.extensions['fragment_cache'] = self
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    def fetch(self, key, render):
+        if not self.app.config['FRAGMENT_CACHE_ENABLED']:
+            return render()
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.requests['hit'] += 1
+                return html
+        html = render()
+        with self._lock:
+            self.requests['miss'] += 1
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.app.config['FRAGMENT_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+"""Conditional GET: strong ETags on rendered pages and ``304 Not Modified`` replies."""
+from flask import g, request
+
+from page_cache import flashes_pending
+
+CONDITIONAL_MIMETYPES = {'text/html', 'application/json'}
+
+
+class ConditionalGet:
+    """Answer revalidation requests for rendered pages without a body.
+
+    Buffered ``GET`` responses get a strong ETag from their body unless
+    the view already set one (the page cache tags snapshots and gives
+    them a ``Last-Modified`` time). ``If-None-Match`` and, without it,
+    ``If-Modified-Since`` are then checked and a match becomes a ``304``.
+
+    Pages that embed a CSRF token or consume flashed messages differ per
+    visitor: they get ``Cache-Control: private, no-cache`` and
+    ``Vary: Cookie`` instead of an ETag.
+
+    Create this after ``Compress``: the hook then runs before compression,
+    so a ``304`` is never compressed. A page is matched against the
+    ``-<encoding>`` ETag compression would give it for this request, so a
+    client is never told a copy in an encoding it no longer accepts is
+    current.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('CONDITIONAL_GET_ENABLED', True)
+        app.extensions['conditional_get'] = self
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def before_request():
+        # Rendering consumes the flashes, so look before the view runs
+        if request.method in ('GET', 'HEAD') and request.endpoint != 'static':
+            g.flashes_pending = flashes_pending()
+
+    def after_request(self, response):
+        if (not self.app.config['CONDITIONAL_GET_ENABLED']
+                or request.method not in ('GET', 'HEAD')
+                or response.status_code != 200
+                or response.is_streamed
+                or response.direct_passthrough
+                or response.mimetype not in CONDITIONAL_MIMETYPES):
+            return response
+        if 'csrf_token' in g or g.get('flashes_pending'):
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        compress = self.app.extensions.get('compress')
+        if compress is not None:
+            # Compression skips 304s, but they must carry the same Vary as the 200
+            response.vary.add('Accept-Encoding')
+        etag, weak = response.get_etag()
+        if etag is None:
+            response.add_etag()
+            etag, weak = response.get_etag()
+        matched = self._matching_etag(etag, compress.encoding_for(response) if compress is not None else None)
+        if matched is not None:
+            response.status_code = 304
+            response.set_etag(matched, weak=weak)
+        elif not request.if_none_match and self._unmodified_since(response.last_modified):
+            response.status_code = 304
+        return response
+
+    @staticmethod
+    def _matching_etag(etag, encoding):
+        """Return the page's tag in the negotiated ``encoding`` if the client has it, else ``None``."""
+        if_none_match = request.if_none_match
+        if not if_none_match:
+            return None
+        candidate = f'{etag}-{encoding}' if encoding else etag
+        if if_none_match.star_tag or if_none_match.contains_weak(candidate):
+            return candidate
+        return None
+
+    @staticmethod
+    def _unmodified_since(last_modified):
+        since = request.if_modified_since
+        return last_modified is not None and since is not None and last_modified <= since
+"""Out-of-band email notifications for new inquiries, sent from a durable outbox."""
+import atexit
+import json
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from collections import Counter
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import click
+
+from inquiry_store import _Transaction, add_missing_column
+
+SUBJECTS = {
+    'service': "New service inquiry from {company}",
+    'contact': "New contact message: {subject}",
+}
+
+
+def header_text(value):
+    """Fold submitted text onto one line for a header; CR/LF there would be rejected or injected."""
+    return ' '.join(str(value).split())
+
+
+class SMTPTransport:
+    """Sends a batch of messages over one SMTP connection."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def send_batch(self, messages):
+        """Send ``messages``; return ``{index: error}`` for the ones that failed."""
+        config = self.config
+        smtp_cls = smtplib.SMTP_SSL if config['MAIL_USE_SSL'] else smtplib.SMTP
+        try:
+            smtp = smtp_cls(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT'])
+        except (OSError, smtplib.SMTPException) as exc:
+            return {i: f"connect: {exc}" for i in range(len(messages))}
+        failures = {}
+        try:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            for i, message in enumerate(messages):
+                try:
+                    smtp.send_message(message)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as exc:
+                    failures[i] = str(exc)
+        except (OSError, smtplib.SMTPException) as exc:
+            # The connection dropped mid-batch: retry all of it, since a
+            # duplicate email is better than a lost lead
+            for i in range(len(messages)):
+                failures.setdefault(i, str(exc))
+        finally:
+            try:
+                smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                smtp.close()
+        return failures
+
+
+class Notifier:
+    """Email the team about new inquiries without touching the request path.
+
+    Registered as an ``InquiryQueue.on_commit`` handler, it only copies
+    committed inquiries into a ``notifications`` outbox table (in the
+    inquiry database by default) and wakes the dispatcher thread. The
+    dispatcher claims due rows in batches, sends each batch over one SMTP
+    connection and reschedules failures with exponential backoff. After
+    ``NOTIFY_MAX_ATTEMPTS`` a row is moved to the ``dead`` state, which is
+    the dead-letter store: ``flask notifications --requeue-dead`` puts those
+    rows back in the queue. Each message goes to the inquiry's team
+    (``NOTIFY_TEAM_RECIPIENTS``), falling back to ``NOTIFY_RECIPIENTS``.
+
+    Every worker process runs a dispatcher; claims take a lease on the
+    rows, so two processes never send the same notification.
+    """
+
+    def __init__(self, app=None, transport=None):
+        self.transport = transport
+        self.deliveries = Counter()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        config.setdefault('MAIL_SERVER', None)
+        config.setdefault('MAIL_PORT', 25)
+        config.setdefault('MAIL_USE_TLS', False)
+        config.setdefault('MAIL_USE_SSL', False)
+        config.setdefault('MAIL_USERNAME', None)
+        config.setdefault('MAIL_PASSWORD', None)
+        config.setdefault('MAIL_TIMEOUT', 10)
+        config.setdefault('MAIL_SENDER', 'noreply@localhost')
+        config.setdefault('NOTIFY_RECIPIENTS', [])
+        config.setdefault('NOTIFY_TEAM_RECIPIENTS', {})
+        config.setdefault('NOTIFY_OUTBOX_PATH', config.get('INQUIRY_DB_PATH'))
+        config.setdefault('NOTIFY_BATCH_SIZE', 20)
+        config.setdefault('NOTIFY_POLL_INTERVAL', 5.0)
+        config.setdefault('NOTIFY_MAX_ATTEMPTS', 8)
+        config.setdefault('NOTIFY_BACKOFF_BASE', 30.0)
+        config.setdefault('NOTIFY_BACKOFF_MAX', 3600.0)
+        config.setdefault('NOTIFY_CLAIM_LEASE', 300.0)
+        app.extensions['notifier'] = self
+        if self.transport is None:
+            self.transport = SMTPTransport(config)
+
+        @app.cli.command('notifications')
+        @click.option('--requeue-dead', is_flag=True, help='Move dead letters back into the send queue.')
+        def notifications_command(requeue_dead):
+            """Show the notification outbox, optionally requeueing dead letters."""
+            self.open()
+            if requeue_dead:
+                print(f"Requeued {self.requeue_dead()} dead notifications")
+            for status, count in sorted(self.counts().items()):
+                print(f"{status}: {count}")
+            for row in self.dead_letters():
+                print(f"  dead {row['inquiry_id']} after {row['attempts']} attempts: {row['last_error']}")
+
+    @property
+    def enabled(self):
+        config = self.app.config
+        return bool(config['MAIL_SERVER'] and (config['NOTIFY_RECIPIENTS'] or config['NOTIFY_TEAM_RECIPIENTS']))
+
+    def open(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.app.config['NOTIFY_OUTBOX_PATH'], timeout=30,
+                               check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS notifications ('
+            ' inquiry_id TEXT PRIMARY KEY,'
+            ' kind TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' next_attempt_at REAL NOT NULL,'
+            ' last_error TEXT,'
+            ' updated_at REAL NOT NULL,'
+            ' team TEXT)'
+        )
+        add_missing_column(conn, 'notifications', 'team', 'TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_notifications_due '
+                     "ON notifications (next_attempt_at) WHERE status = 'pending'")
+        self._conn = conn
+
+    def start(self):
+        """Open the outbox and start this process's dispatcher thread."""
+        if not self.enabled or self._thread is not None:
+            return
+        self.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='notify-dispatcher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=self.app.config['MAIL_TIMEOUT'] * 2)
+        self._thread = None
+
+    def enqueue(self, records):
+        """``on_commit`` handler: copy committed inquiries into the outbox."""
+        if not self.enabled:
+            return
+        self.open()
+        now = time.time()
+        rows = [(r['id'], r['kind'], json.dumps(r['data']), r.get('team'), now, now) for r in records]
+        with self._lock, _Transaction(self._conn, 'BEGIN') as conn:
+            conn.executemany('INSERT OR IGNORE INTO notifications '
+                             '(inquiry_id, kind, payload, team, next_attempt_at, updated_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.app.config['NOTIFY_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                while not self._stop.is_set() and self._dispatch_batch():
+                    pass
+            except Exception:
+                self.app.logger.exception("Notification dispatcher failed; retrying on the next poll")
+
+    def _dispatch_batch(self):
+        """Send one batch of due notifications; return whether there was one."""
+        rows = self._claim()
+        if not rows:
+            return False
+        # A row that cannot be built fails on its own, like one the relay refuses
+        failures, built, messages = {}, [], []
+        for i, row in enumerate(rows):
+            try:
+                messages.append(self.build_message(row['kind'], json.loads(row['payload']),
+                                                   row['inquiry_id'], row['team']))
+                built.append(i)
+            except Exception as exc:
+                failures[i] = f"build: {exc!r}"
+        if messages:
+            try:
+                sent = self.transport.send_batch(messages)
+            except Exception as exc:
+                sent = {j: f"send: {exc!r}" for j in range(len(messages))}
+            failures.update((built[j], error) for j, error in sent.items())
+        self._settle(rows, failures)
+        return True
+
+    def _claim(self):
+        now = time.time()
+        with self._lock, _Transaction(self._conn, 'BEGIN IMMEDIATE') as conn:
+            rows = conn.execute("SELECT inquiry_id, kind, payload, team, attempts FROM notifications "
+                                "WHERE status = 'pending' AND next_attempt_at <= ? "
+                                "ORDER BY next_attempt_at LIMIT ?",
+                                (now, self.app.config['NOTIFY_BATCH_SIZE'])).fetchall()
+            lease = now + self.app.config['NOTIFY_CLAIM_LEASE']
+            conn.executemany('UPDATE notifications SET next_attempt_at = ? WHERE inquiry_id = ?',
+                             [(lease, row['inquiry_id']) for row in rows])
+        return rows
+
+    def _settle(self, rows, failures):
+        config = self.app.config
+        now = time.time()
+        updates = []
+        for i, row in enumerate(rows):
+            if i not in failures:
+                self.deliveries['sent'] += 1
+                updates.append(('sent', row['attempts'] + 1, now, None, now, row['inquiry_id']))
+                continue
+            attempts = row['attempts'] + 1
+            error = failures[i]
+            if attempts >= config['NOTIFY_MAX_ATTEMPTS']:
+                self.deliveries['dead'] += 1
+                self.app.logger.error("Giving up on notification for inquiry %s after %d attempts: %s",
+                                      row['inquiry_id'], attempts, error)
+                updates.append(('dead', attempts, now, error, now, row['inquiry_id']))
+                continue
+            self.deliveries['retry'] += 1
+            delay = min(config['NOTIFY_BACKOFF_MAX'], config['NOTIFY_BACKOFF_BASE'] * 2 ** (attempts - 1))
+            delay *= random.uniform(0.8, 1.2)
+            self.app.logger.warning("Notification for inquiry %s failed (attempt %d), retrying in %.0fs: %s",
+                                    row['inquiry_id'], attempts, delay, error)
+            updates.append(('pending', attempts, now + delay, error, now, row['inquiry_id']))
+        with self._lock, _Transaction(self._conn, 'BEGIN') as conn:
+            conn.executemany('UPDATE notifications SET status = ?, attempts = ?, next_attempt_at = ?, '
+                             'last_error = ?, updated_at = ? WHERE inquiry_id = ?', updates)
+
+    def recipients(self, team):
+        config = self.app.config
+        return config['NOTIFY_TEAM_RECIPIENTS'].get(team) or config['NOTIFY_RECIPIENTS']
+
+    def build_message(self, kind, data, inquiry_id, team=None):
+        config = self.app.config
+        message = EmailMessage()
+        subject = header_text(SUBJECTS.get(kind, "New {kind} inquiry").format(kind=kind, **data))
+        message['Subject'] = f"[{header_text(team)}] {subject}" if team else subject
+        message['From'] = config['MAIL_SENDER']
+        message['To'] = ', '.join(self.recipients(team))
+        if data.get('email'):
+            message['Reply-To'] = header_text(data['email'])
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid(idstring=inquiry_id, domain=config['MAIL_SENDER'].rpartition('@')[2] or None)
+        width = max(len(key) for key in data) if data else 0
+        lines = [f"{key.replace('_', ' ').title():<{width + 1}} {value}"
+                 for key, value in data.items() if key not in ('message', 'project_details')]
+        for key in ('message', 'project_details'):
+            if data.get(key):
+                lines += ['', key.replace('_', ' ').title() + ':', data[key]]
+        lines += ['', f"Team: {team or 'unassigned'}", f"Inquiry id: {inquiry_id}"]
+        message.set_content('\n'.join(lines))
+        return message
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM notifications GROUP BY status'))
+
+    def dead_letters(self, limit=50):
+        with self._lock:
+            return self._conn.execute("SELECT inquiry_id, attempts, last_error FROM notifications "
+                                      "WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?",
+                                      (limit,)).fetchall()
+
+    def requeue_dead(self):
+        now = time.time()
+        with self._lock, _Transaction(self._conn, 'BEGIN') as conn:
+            return conn.execute("UPDATE notifications SET status = 'pending', attempts = 0, "
+                                "next_attempt_at = ?, updated_at = ? WHERE status = 'dead'",
+                                (now, now)).rowcount
+"""Rules-based assignment of inquiries to team queues."""
+import json
+import re
+import time
+from collections import Counter, defaultdict, namedtuple
+
+import click
+
+Rule = namedtuple('Rule', 'name team priority order service_types keywords companies')
+Assignment = namedtuple('Assignment', 'team rule')
+
+WORD = re.compile(r'[a-z0-9]+')
+COMPANY_SUFFIXES = frozenset({'inc', 'llc', 'ltd', 'corp', 'corporation', 'co', 'company', 'plc', 'group'})
+TEXT_FIELDS = ('project_details', 'subject', 'message')
+
+# Default precedence when a rule does not set ``priority``: the more specific matcher wins
+PRIORITIES = {'company': 300, 'keyword': 200, 'service': 100, 'default': 0}
+
+# Inquiries whose service type says little about the work ('custom_solution',
+# 'consultation' and contact messages) are refined by keywords
+OPEN_ENDED = ['custom_solution', 'consultation', None]
+
+DEFAULT_RULES = {
+    'default_team': 'sales',
+    'rules': [
+        {'team': 'structural', 'service_types': ['structural_testing']},
+        {'team': 'ndt', 'service_types': ['ndt_inspection']},
+        {'team': 'geotechnical', 'service_types': ['geotechnical_testing']},
+        {'team': 'engineering', 'service_types': ['custom_solution', 'consultation']},
+        {'team': 'rentals', 'service_types': ['equipment_rental']},
+        {'team': 'training', 'service_types': ['training_certification']},
+        {'team': 'structural', 'service_types': OPEN_ENDED,
+         'keywords': ['load test', 'load testing', 'strain gauge', 'deflection', 'load frame', 'fatigue']},
+        {'team': 'ndt', 'service_types': OPEN_ENDED,
+         'keywords': ['ultrasonic', 'ground penetrating radar', 'gpr', 'rebound hammer', 'half cell',
+                      'corrosion', 'rebar scan', 'impact echo']},
+        {'team': 'geotechnical', 'service_types': OPEN_ENDED,
+         'keywords': ['pile', 'piles', 'borehole', 'soil', 'settlement', 'inclinometer', 'piezometer',
+                      'foundation']},
+        {'team': 'rentals', 'service_types': OPEN_ENDED, 'keywords': ['rent', 'rental', 'hire', 'lease']},
+        {'team': 'training', 'service_types': OPEN_ENDED,
+         'keywords': ['training', 'course', 'certification', 'workshop']},
+    ],
+}
+
+
+def normalize_company(name):
+    words = [w for w in WORD.findall((name or '').lower()) if w not in COMPANY_SUFFIXES]
+    return ' '.join(words)
+
+
+class RuleSet:
+    """Rules compiled into hash-keyed dispatch tables.
+
+    A rule names a ``team`` and any of ``service_types``, ``keywords``
+    (words or phrases) and ``companies``; all given conditions must hold.
+    Each rule is filed under its most selective condition: company name,
+    keyword (as a word tuple) or service type. Routing looks up the
+    inquiry's company, every word n-gram of its text and its service type,
+    so the work per inquiry depends on the text length, not on the number
+    of rules. The highest ``priority`` among matching rules wins, then the
+    earliest rule.
+    """
+
+    def __init__(self, spec):
+        self.default_team = spec.get('default_team', 'sales')
+        self.by_company = defaultdict(list)
+        self.by_keyword = defaultdict(list)
+        self.by_service = defaultdict(list)
+        self.catch_all = []
+        self.max_phrase = 1
+        self.rules = []
+        for order, raw in enumerate(spec.get('rules', ())):
+            self._add(order, raw)
+
+    @classmethod
+    def load(cls, path=None):
+        if path is None:
+            return cls(DEFAULT_RULES)
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _add(self, order, raw):
+        if 'team' not in raw:
+            raise ValueError(f"Routing rule {order} has no team")
+        keywords = frozenset(tuple(WORD.findall(k.lower())) for k in raw.get('keywords', ()))
+        companies = frozenset(normalize_company(c) for c in raw.get('companies', ()))
+        service_types = frozenset(raw['service_types']) if 'service_types' in raw else None
+        matcher = ('company' if companies else 'keyword' if keywords
+                   else 'service' if service_types is not None else 'default')
+        rule = Rule(raw.get('name', f"{raw['team']}#{order}"), raw['team'],
+                    raw.get('priority', PRIORITIES[matcher]), order, service_types, keywords, companies)
+        self.rules.append(rule)
+        if companies:
+            for company in companies:
+                self.by_company[company].append(rule)
+        elif keywords:
+            for phrase in keywords:
+                self.by_keyword[phrase].append(rule)
+                self.max_phrase = max(self.max_phrase, len(phrase))
+        elif service_types is not None:
+            for service_type in service_types:
+                self.by_service[service_type].append(rule)
+        else:
+            self.catch_all.append(rule)
+
+    def route(self, data):
+        """Return the ``Assignment`` for an inquiry payload."""
+        service_type = data.get('service_type') or None
+        company = normalize_company(data.get('company'))
+        words = WORD.findall(' '.join(data.get(field) or '' for field in TEXT_FIELDS).lower())
+        phrases = {tuple(words[i:i + n]) for n in range(1, self.max_phrase + 1)
+                   for i in range(len(words) - n + 1)}
+
+        candidates = list(self.by_company.get(company, ()))
+        for phrase in phrases:
+            candidates.extend(self.by_keyword.get(phrase, ()))
+        candidates.extend(self.by_service.get(service_type, ()))
+        candidates.extend(self.catch_all)
+
+        best = None
+        for rule in candidates:
+            if rule.service_types is not None and service_type not in rule.service_types:
+                continue
+            if rule.keywords and rule.keywords.isdisjoint(phrases):
+                continue
+            if rule.companies and company not in rule.companies:
+                continue
+            if best is None or (rule.priority, -rule.order) > (best.priority, -best.order):
+                best = rule
+        if best is None:
+            return Assignment(self.default_team, None)
+        return Assignment(best.team, best.name)
+
+
+class LeadRouter:
+    """Assigns each inquiry a team with a ``RuleSet``.
+
+    Rules come from the JSON file at ``LEAD_ROUTING_RULES`` (built-in
+    defaults otherwise). ``flask route-leads`` replays stored inquiries
+    through a rule set as a dry run, reporting the team split, how many
+    assignments would change and the routing cost per inquiry; ``--apply``
+    writes the new teams back.
+    """
+
+    def __init__(self, app=None):
+        self.assignments = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('LEAD_ROUTING_RULES', None)
+        app.extensions['lead_router'] = self
+        self.rules = RuleSet.load(app.config['LEAD_ROUTING_RULES'])
+
+        @app.cli.command('route-leads')
+        @click.option('--rules', type=click.Path(exists=True, dir_okay=False),
+                      help='Rule file to evaluate instead of the configured one.')
+        @click.option('--apply', is_flag=True, help='Store the new assignments instead of a dry run.')
+        @click.option('--repeat', default=20, show_default=True, type=click.IntRange(min=1),
+                      help='Routing passes used for timing.')
+        def route_leads_command(rules, apply, repeat):
+            """Route the stored inquiries through a rule set and report the result."""
+            self.evaluate(RuleSet.load(rules) if rules else self.rules, apply, repeat)
+
+    def route(self, data):
+        assignment = self.rules.route(data)
+        self.assignments[assignment.team] += 1
+        return assignment
+
+    def evaluate(self, rules, apply=False, repeat=20):
+        store = self.app.extensions['inquiry_queue']
+        store.open_backend()
+        inquiries = store.backend.all_assignments()
+        if not inquiries:
+            print("No stored inquiries to route")
+            return
+        start = time.perf_counter()
+        for _ in range(repeat):
+            routed = [(inquiry_id, rules.route(data).team) for inquiry_id, data, _ in inquiries]
+        per_inquiry = (time.perf_counter() - start) / (repeat * len(inquiries))
+        current = {inquiry_id: team for inquiry_id, _, team in inquiries}
+        changed = [(inquiry_id, team) for inquiry_id, team in routed if current[inquiry_id] != team]
+        print(f"{len(inquiries)} inquiries, {len(rules.rules)} rules, "
+              f"{per_inquiry * 1e6:.1f} us per inquiry")
+        for team, count in Counter(team for _, team in routed).most_common():
+            print(f"  {team:<16}{count:>6}")
+        print(f"{len(changed)} assignments would change")
+        if apply and changed:
+            store.backend.assign_teams(changed)
+            print(f"Updated {len(changed)} inquiries")
+"""Authenticated inquiry dashboard with keyset pagination and streaming CSV export."""
+import base64
+import binascii
+import csv
+import hashlib
+import hmac
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Response, abort, render_template, request, stream_with_context, url_for
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from inquiry_store import InquiryReader
+
+CSV_FIELDS = ('id', 'created_at', 'kind', 'team', 'service_type', 'company', 'name', 'email', 'phone',
+              'subject', 'message', 'project_details')
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class InquiryAdmin:
+    """``/admin/inquiries``: browse, filter, search and export stored inquiries.
+
+    Access is HTTP Basic auth against ``ADMIN_USERNAME`` and
+    ``ADMIN_PASSWORD_HASH`` (made with ``flask admin-password``); without a
+    hash the routes answer ``404``. Pages are read newest first with a
+    ``(created_at, id)`` cursor, so every page costs one index range scan
+    however deep the visitor goes. ``/admin/inquiries.csv`` exports the
+    same filtered set, reading and writing a chunk of rows at a time.
+    """
+
+    def __init__(self, app=None, service_types=()):
+        self.service_types = [choice for choice in service_types if choice[0]]
+        self._verified = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('ADMIN_USERNAME', 'admin')
+        app.config.setdefault('ADMIN_PASSWORD_HASH', None)
+        app.config.setdefault('ADMIN_PAGE_SIZE', 50)
+        app.config.setdefault('ADMIN_EXPORT_CHUNK', 500)
+        app.extensions['inquiry_admin'] = self
+        self.reader = InquiryReader(app.config['INQUIRY_DB_PATH'])
+        app.add_url_rule('/admin/inquiries', 'admin_inquiries', self.inquiries_view)
+        app.add_url_rule('/admin/inquiries.csv', 'admin_inquiries_csv', self.export_view)
+        app.add_template_filter(_format_time, 'inquiry_time')
+
+        @app.cli.command('admin-password')
+        @click.password_option()
+        def admin_password_command(password):
+            """Print an ADMIN_PASSWORD_HASH value for the given password."""
+            print(generate_password_hash(password))
+
+    def authorize(self):
+        password_hash = self.app.config['ADMIN_PASSWORD_HASH']
+        if not password_hash:
+            abort(404)
+        auth = request.authorization
+        if auth is None or auth.type != 'basic' or not self._check(auth.username or '', auth.password or ''):
+            abort(Response("Authentication required", 401, {'WWW-Authenticate': 'Basic realm="Inquiries"'}))
+
+    def _check(self, username, password):
+        """Verify credentials, remembering good ones so the slow hash runs once per process."""
+        digest = hashlib.sha256(f'{username}\0{password}'.encode()).digest()
+        if digest in self._verified:
+            return True
+        # Check both every time, so a wrong username takes as long as a wrong password
+        username_ok = hmac.compare_digest(username.encode(), self.app.config['ADMIN_USERNAME'].encode())
+        password_ok = check_password_hash(self.app.config['ADMIN_PASSWORD_HASH'], password)
+        if not (username_ok and password_ok):
+            return False
+        self._verified.add(digest)
+        return True
+
+    def filters(self):
+        """Parse the filter query string, aborting with ``400`` on bad dates."""
+        args = request.args
+        filters = {
+            'service_type': args.get('service_type', '').strip(),
+            'domain': args.get('domain', '').strip().lstrip('@').lower(),
+            'team': args.get('team', '').strip(),
+            'q': args.get('q', '').strip(),
+            'since': None,
+            'until': None,
+        }
+        try:
+            if args.get('since'):
+                filters['since'] = _day(args['since']).timestamp()
+            if args.get('until'):
+                filters['until'] = (_day(args['until']) + timedelta(days=1)).timestamp()
+        except ValueError:
+            abort(400, description="Dates must be YYYY-MM-DD")
+        return filters
+
+    def inquiries_view(self):
+        self.authorize()
+        filters = self.filters()
+        after = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        records, cursor = self.reader.page(filters, after, self.app.config['ADMIN_PAGE_SIZE'])
+        query = {key: value for key, value in request.args.items() if key != 'cursor' and value}
+        next_url = url_for('admin_inquiries', **query, cursor=_encode_cursor(cursor)) if cursor else None
+        response = Response(render_template('admin_inquiries.html', records=records, args=query,
+                                            service_types=self.service_types, next_url=next_url,
+                                            export_url=url_for('admin_inquiries_csv', **query)))
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+
+    def export_view(self):
+        self.authorize()
+        records = self.reader.iter_records(self.filters(), self.app.config['ADMIN_EXPORT_CHUNK'])
+        filename = f"inquiries-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.csv"
+        response = Response(stream_with_context(_csv_rows(records)), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+
+
+def _csv_rows(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    for count, record in enumerate(records, 1):
+        data = record['data']
+        created = datetime.fromtimestamp(record['created_at'], timezone.utc).isoformat(timespec='seconds')
+        row = [record['id'], created, record['kind'], record['team'] or '']
+        row += [data.get(field) or '' for field in CSV_FIELDS[4:]]
+        writer.writerow([_safe_cell(value) for value in row])
+        if count % 100 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _safe_cell(value):
+    """Keep spreadsheet apps from evaluating visitor-supplied text as a formula."""
+    value = str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+
+
+def _day(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+def _encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(value):
+    try:
+        created_at, inquiry_id = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        return float(created_at), str(inquiry_id)
+    except (binascii.Error, ValueError, TypeError):
+        abort(400, description="Invalid cursor")
+"""Session-free CSRF tokens, so form pages can be served from the page cache."""
+import base64
+import hashlib
+import hmac
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash
-from flask_wtf.csrf import CSRFProtect
-from forms import ContactForm, ServiceInquiryForm
+import secrets
+import time
+
+from flask import current_app, g, request
+from flask_wtf.csrf import CSRFProtect, generate_csrf, same_origin, validate_csrf
+from wtforms import ValidationError
+from wtforms.csrf.core import CSRF
+
+logger = logging.getLogger(__name__)
+
+
+class DoubleSubmitCSRF(CSRFProtect):
+    """``CSRFProtect`` with a stateless token mode.
+
+    With ``CSRF_MODE = 'session'`` this is plain Flask-WTF. With
+    ``'stateless'`` a visitor is given a random ``CSRF_COOKIE_NAME`` cookie
+    once, and a token is ``<window>.<HMAC(secret, cookie, window)>`` where
+    ``window`` counts ``CSRF_TOKEN_WINDOW``-second periods. A post must
+    carry the token for its own cookie from the current or the previous
+    window, so a token lives at most ``WTF_CSRF_TIME_LIMIT`` seconds, as
+    before; the HTTPS referrer check is unchanged.
+
+    Nothing is written to the session, so a form page is the same for
+    every visitor except for the token, which the page cache fills into
+    its snapshot on each hit.
+    """
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.app = app
+        app.config.setdefault('CSRF_MODE', 'session')
+        app.config.setdefault('CSRF_COOKIE_NAME', 'csrf_nonce')
+        app.config.setdefault('CSRF_COOKIE_MAX_AGE', 365 * 24 * 3600)
+        # Stateless tokens always expire; with no time limit they last Flask-WTF's default hour
+        app.config.setdefault('CSRF_TOKEN_WINDOW', (app.config['WTF_CSRF_TIME_LIMIT'] or 3600) // 2)
+        secret = app.config.get('WTF_CSRF_SECRET_KEY') or app.secret_key
+        self._key = hashlib.sha256(b'csrf-double-submit:' + secret.encode()).digest()
+        app.jinja_env.globals['csrf_token'] = self.generate_token
+        app.context_processor(lambda: {'csrf_token': self.generate_token})
+        app.after_request(self._set_cookie)
+
+    @property
+    def stateless(self):
+        return self.app.config['CSRF_MODE'] == 'stateless'
+
+    def generate_token(self):
+        """The token for the current visitor (a page cache placeholder while a snapshot is built)."""
+        if not self.stateless:
+            return generate_csrf()
+        page_cache = self.app.extensions.get('page_cache')
+        placeholder = page_cache.placeholder('csrf_token', self.issue_token) if page_cache is not None else None
+        return placeholder or self.issue_token()
+
+    def issue_token(self):
+        if 'csrf_token' not in g:
+            window = int(time.time() // self.app.config['CSRF_TOKEN_WINDOW'])
+            g.csrf_token = f'{window:x}.{self._signature(self._nonce(), window)}'
+        return g.csrf_token
+
+    def validate_token(self, token):
+        """Raise ``ValidationError`` unless ``token`` is current and bound to this visitor's cookie."""
+        if not self.stateless:
+            return validate_csrf(token)
+        if not token:
+            raise ValidationError("The CSRF token is missing.")
+        nonce = request.cookies.get(self.app.config['CSRF_COOKIE_NAME'])
+        if not nonce:
+            raise ValidationError("The CSRF cookie is missing.")
+        window, _, signature = token.partition('.')
+        try:
+            window = int(window, 16)
+        except ValueError:
+            raise ValidationError("The CSRF token is invalid.") from None
+        current = int(time.time() // self.app.config['CSRF_TOKEN_WINDOW'])
+        if not current - 1 <= window <= current:
+            raise ValidationError("The CSRF token has expired.")
+        if not hmac.compare_digest(signature, self._signature(nonce, window)):
+            raise ValidationError("The CSRF tokens do not match.")
+
+    def protect(self, apply_exemptions=False):
+        if not self.stateless:
+            return super().protect(apply_exemptions)
+        if apply_exemptions and (not request.endpoint or self._is_exempt()):
+            return
+        if request.method not in current_app.config['WTF_CSRF_METHODS']:
+            return
+        try:
+            self.validate_token(self._get_csrf_token())
+        except ValidationError as e:
+            logger.info(e.args[0])
+            self._error_response(e.args[0])
+        if request.is_secure and current_app.config['WTF_CSRF_SSL_STRICT']:
+            if not request.referrer:
+                self._error_response("The referrer header is missing.")
+            if not same_origin(request.referrer, f'https://{request.host}/'):
+                self._error_response("The referrer does not match the host.")
+        g.csrf_valid = True
+
+    def _signature(self, nonce, window):
+        digest = hmac.new(self._key, f'{nonce}.{window:x}'.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+    def _nonce(self):
+        nonce = request.cookies.get(self.app.config['CSRF_COOKIE_NAME'])
+        if not nonce or len(nonce) > 64:
+            nonce = g._csrf_new_nonce = secrets.token_urlsafe(16)
+        return nonce
+
+    def _set_cookie(self, response):
+        nonce = g.pop('_csrf_new_nonce', None)
+        if nonce is not None:
+            response.set_cookie(self.app.config['CSRF_COOKIE_NAME'], nonce,
+                                max_age=self.app.config['CSRF_COOKIE_MAX_AGE'], httponly=True,
+                                secure=self.app.config['SESSION_COOKIE_SECURE'], samesite='Lax')
+        return response
+
+
+class FormCSRF(CSRF):
+    """Form ``csrf_token`` field that follows the app's ``CSRF_MODE``."""
+
+    def generate_csrf_token(self, csrf_token_field):
+        return current_app.extensions['csrf'].generate_token()
+
+    def validate_csrf_token(self, form, field):
+        if g.get('csrf_valid', False):
+            return  # already checked before the view ran
+        current_app.extensions['csrf'].validate_token(field.data)
+"""Client-side validation rules compiled from the WTForms form classes."""
+import hashlib
+import json
+
+from flask import Response, abort, url_for
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, Email, InputRequired, Length, Optional
+
+from assets import IMMUTABLE_MAX_AGE
+
+
+def length_message(validator):
+    """The message WTForms would show for a ``Length`` failure, with the bounds filled in.
+
+    Only ``%(...)`` placeholders are substituted, so a message with a
+    literal ``%`` is kept as written; ``%(length)d`` has no client-side
+    value and leaves the message unformatted.
+    """
+    def characters(count):
+        return 'character' if count == 1 else 'characters'
+
+    message = validator.message
+    if message is None:
+        if validator.max == -1:
+            message = f"Field must be at least %(min)d {characters(validator.min)} long."
+        elif validator.min == -1:
+            message = f"Field cannot be longer than %(max)d {characters(validator.max)}."
+        elif validator.min == validator.max:
+            message = f"Field must be exactly %(max)d {characters(validator.max)} long."
+        else:
+            message = "Field must be between %(min)d and %(max)d characters long."
+    if '%(' not in message:
+        return message
+    try:
+        return message % {'min': validator.min, 'max': validator.max}
+    except (KeyError, TypeError, ValueError):
+        return message
+
+
+def compile_rules(form_class):
+    """Translate a form class's validators into the rules ``main.js`` checks.
+
+    Each field maps to ``required`` and ``email`` messages, a ``length``
+    of ``[min, max, message]`` (``-1`` for no bound) and an ``optional``
+    flag. Validators without a client-side equivalent are left to the
+    server.
+    """
+    fields = sorted(((name, value) for name in dir(form_class)
+                     if isinstance(value := getattr(form_class, name), UnboundField)),
+                    key=lambda item: item[1].creation_counter)
+    rules = {}
+    for name, field in fields:
+        field_rules = {}
+        for validator in field.kwargs.get('validators') or ():
+            if isinstance(validator, (DataRequired, InputRequired)):
+                field_rules['required'] = validator.message or "This field is required."
+            elif isinstance(validator, Optional):
+                field_rules['optional'] = True
+            elif isinstance(validator, Email):
+                field_rules['email'] = validator.message or "Invalid email address."
+            elif isinstance(validator, Length):
+                field_rules['length'] = [validator.min, validator.max, length_message(validator)]
+        if field_rules:
+            rules[name] = field_rules
+    return rules
+
+
+class FormRules:
+    """Serve each form's compiled rules as a fingerprinted JSON file.
+
+    ``form_rules_url('contact')`` in a template gives
+    ``/forms/contact.<hash>.json``; the hash changes whenever the
+    validators do, so the file is cached as immutable, like the static
+    assets.
+    """
+
+    def __init__(self, app=None, forms=None):
+        self.forms = dict(forms or {})
+        self.compiled = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['form_rules'] = self
+        for name, form_class in self.forms.items():
+            body = json.dumps(compile_rules(form_class), separators=(',', ':')).encode()
+            self.compiled[name] = (body, hashlib.sha256(body).hexdigest()[:12])
+        app.add_url_rule('/forms/<name>.<version>.json', 'form_rules', self.rules_view)
+        app.add_template_global(self.form_rules_url)
+
+    def form_rules_url(self, name):
+        return url_for('form_rules', name=name, version=self.compiled[name][1])
+
+    def rules_view(self, name, version):
+        entry = self.compiled.get(name)
+        if entry is None or entry[1] != version:
+            abort(404)
+        body, digest = entry
+        response = Response(body, mimetype='application/json')
+        response.set_etag(digest)
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+"""Content-only renders of the site's pages for in-place navigation."""
+from flask import request
+
+PARTIAL_HEADER = 'X-Partial'
+
+
+class PartialNavigation:
+    """Answer ``main.js`` navigations with only the part of a page that changes.
+
+    A request with ``X-Partial: content`` gets ``base.html`` in its partial
+    form: the page's title, meta description, flashed messages and main
+    content, without the head, navbar, footer and scripts the browser
+    already has. Both forms of a URL are cacheable, so HTML responses carry
+    ``Vary: X-Partial`` and the page cache keeps a snapshot of each.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PARTIAL_NAVIGATION', True)
+        app.extensions['partial_navigation'] = self
+        app.context_processor(lambda: {'partial_navigation': self.requested()})
+        app.after_request(self.after_request)
+
+    def requested(self):
+        return self.app.config['PARTIAL_NAVIGATION'] and request.headers.get(PARTIAL_HEADER) == 'content'
+
+    def after_request(self, response):
+        if response.mimetype == 'text/html':
+            response.vary.add(PARTIAL_HEADER)
+        return response
+"""Low-priority handling of link prefetches, with counts of how many get used."""
+import threading
+from collections import Counter
+
+from flask import Response, g, request
+from itsdangerous import BadSignature, Signer
+
+from page_cache import flashes_pending
+
+# Signed count of prefetches served to a visitor and not yet reported
+CREDIT_COOKIE = 'prefetch_credit'
+MAX_CREDIT = 50
+
+
+class PrefetchPolicy:
+    """Serve speculative page loads only when they are cheap.
+
+    A request is a prefetch when it carries ``Sec-Purpose: prefetch`` (the
+    browser's own prefetches) or ``Purpose: prefetch`` (``main.js``, which
+    cannot set ``Sec-`` headers). Prefetches of page-cache snapshots are
+    always answered. Anything that would be rendered live is declined with
+    ``503`` once ``PREFETCH_BUSY_THRESHOLD`` other requests are in flight
+    in this process, so speculation never delays real visitors. A
+    prefetch is also declined while the visitor has flashed messages, which
+    only a real navigation may consume.
+
+    ``requests`` counts prefetches by result (``cache``, ``rendered``,
+    ``declined``). ``outcomes`` counts the ``used`` and ``unused``
+    prefetches that ``main.js`` reports (``report()``) when the page is
+    hidden. Together they give the prefetch hit rate. Every prefetch
+    answered adds one to a signed ``prefetch_credit`` cookie, and a report
+    only counts as many pages as the visitor has credit for, so clients
+    that were never sent a prefetch cannot move the hit rate.
+    """
+
+    def __init__(self, app=None):
+        self.requests = Counter()
+        self.outcomes = Counter()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PREFETCH_ENABLED', True)
+        app.config.setdefault('PREFETCH_BUSY_THRESHOLD', 2)
+        app.extensions['prefetch'] = self
+        self.signer = Signer(app.secret_key, salt='prefetch-credit')
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self._finished)
+
+    @staticmethod
+    def is_prefetch():
+        purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+        return purpose.split(';')[0].strip() == 'prefetch'
+
+    def before_request(self):
+        with self._lock:
+            busy = self._in_flight >= self.app.config['PREFETCH_BUSY_THRESHOLD']
+            self._in_flight += 1
+        g._counted_in_flight = True
+        if request.method != 'GET' or not self.is_prefetch():
+            return None
+        g.prefetch = True
+        if not self.app.config['PREFETCH_ENABLED'] or flashes_pending():
+            return self._decline()
+        page_cache = self.app.extensions.get('page_cache')
+        if busy and not (page_cache is not None and page_cache.serves(request.endpoint)):
+            return self._decline()
+        return None
+
+    def _decline(self):
+        self.requests['declined'] += 1
+        g.prefetch_declined = True
+        response = Response(status=503)
+        response.retry_after = 10
+        response.cache_control.no_store = True
+        return response
+
+    def after_request(self, response):
+        if g.get('prefetch') and not g.get('prefetch_declined'):
+            self.requests['cache' if g.get('page_cache_hit') else 'rendered'] += 1
+            if response.status_code == 200:
+                self._set_credit(response, self._credit() + 1)
+        return response
+
+    def _credit(self):
+        try:
+            return int(self.signer.unsign(request.cookies.get(CREDIT_COOKIE, '')))
+        except (BadSignature, ValueError):
+            return 0
+
+    def _set_credit(self, response, credit):
+        if credit <= 0:
+            response.delete_cookie(CREDIT_COOKIE)
+            return
+        value = self.signer.sign(str(min(credit, MAX_CREDIT))).decode()
+        response.set_cookie(CREDIT_COOKIE, value, httponly=True, samesite='Lax', secure=request.is_secure)
+        # A response setting a visitor's cookie must not be stored by shared caches
+        response.cache_control.public = False
+        response.cache_control.private = True
+
+    def _finished(self, exc):
+        if g.pop('_counted_in_flight', False):
+            with self._lock:
+                self._in_flight -= 1
+
+    def report(self):
+        """Count a ``{"used": n, "unused": n}`` report against the visitor's credit."""
+        report = request.get_json(silent=True)
+        if not isinstance(report, dict):
+            return Response(status=400)
+        credit = self._credit()
+        response = Response(status=204)
+        for result in ('used', 'unused'):
+            count = report.get(result)
+            if isinstance(count, int) and count > 0 and credit > 0:
+                accepted = min(count, credit)
+                self.outcomes[result] += accepted
+                credit -= accepted
+        if CREDIT_COOKIE in request.cookies:
+            self._set_credit(response, credit)
+        return response
+"""Test setup: make the application modules importable from the project root."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+"""Notification outbox against a local SMTP stand-in."""
+import socketserver
+import threading
+import uuid
+from email import message_from_bytes, policy
+
+import pytest
+from flask import Flask
+
+from notifications import Notifier
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server to accept mail and keep what it receives."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSession)
+        self.messages = []
+        self.refused = set()
+
+
+class SMTPSession(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.reply('220 stand-in ready')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO', 'NOOP'):
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.partition(':')[2].strip('<> ')
+                if address in self.server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.receive(recipients)
+                self.reply('250 Queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+    def receive(self, recipients):
+        body = []
+        for line in self.rfile:
+            if line.rstrip(b'\r\n') == b'.':
+                break
+            body.append(line[1:] if line.startswith(b'..') else line)
+        message = message_from_bytes(b''.join(body), policy=policy.default)
+        self.server.messages.append((recipients, message))
+
+    def reply(self, text):
+        self.wfile.write(text.encode() + b'\r\n')
+
+
+@pytest.fixture
+def relay():
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def notifier(relay, tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=relay.server_address[1],
+        MAIL_TIMEOUT=5,
+        NOTIFY_RECIPIENTS=['sales@example.com'],
+        NOTIFY_TEAM_RECIPIENTS={'ndt': ['ndt@example.com']},
+        NOTIFY_OUTBOX_PATH=str(tmp_path / 'outbox.db'),
+        NOTIFY_MAX_ATTEMPTS=3,
+        NOTIFY_BACKOFF_BASE=0.0,
+    )
+    notifier = Notifier(app)
+    notifier.open()
+    return notifier
+
+
+def inquiry(kind='contact', team=None, **data):
+    fields = {'name': 'Ada', 'email': 'ada@example.com', 'subject': 'Quote', 'message': 'Hello'}
+    fields.update(data)
+    return {'id': uuid.uuid4().hex, 'kind': kind, 'data': fields, 'team': team}
+
+
+def outbox_row(notifier, record):
+    return notifier._conn.execute('SELECT status, attempts, last_error FROM notifications WHERE inquiry_id = ?',
+                                  (record['id'],)).fetchone()
+
+
+def test_batch_is_delivered_to_each_team(notifier, relay):
+    records = [inquiry(), inquiry(team='ndt')]
+    notifier.enqueue(records)
+
+    assert notifier._dispatch_batch()
+    assert not notifier._dispatch_batch()
+    assert [recipients for recipients, _ in relay.messages] == [['sales@example.com'], ['ndt@example.com']]
+    assert relay.messages[1][1]['Subject'] == '[ndt] New contact message: Quote'
+    assert all(outbox_row(notifier, r)['status'] == 'sent' for r in records)
+    assert notifier.deliveries['sent'] == 2
+
+
+def test_line_breaks_in_header_fields_are_folded(notifier, relay):
+    record = inquiry(subject='Quote\r\nBcc: victim@example.com', email='ada@example.com\nCc: x@example.com')
+    notifier.enqueue([record])
+    notifier._dispatch_batch()
+
+    recipients, message = relay.messages[0]
+    assert recipients == ['sales@example.com']
+    assert message['Subject'] == 'New contact message: Quote Bcc: victim@example.com'
+    assert message['Bcc'] is None and message['Cc'] is None
+    assert outbox_row(notifier, record)['status'] == 'sent'
+
+
+def test_poison_row_fails_alone_and_is_dead_lettered(notifier, relay):
+    poison = inquiry(kind='service')  # no company for the subject line
+    good = [inquiry(), inquiry()]
+    notifier.enqueue([poison, *good])
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+    notifier._dispatch_batch()
+    assert len(relay.messages) == 2
+    assert all(outbox_row(notifier, r)['status'] == 'sent' for r in good)
+    status, attempts, error = outbox_row(notifier, poison)
+    assert (status, attempts) == ('pending', 1)
+    assert error.startswith('build:')
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    while notifier._dispatch_batch():
+        pass
+    assert tuple(outbox_row(notifier, poison))[:2] == ('dead', 3)
+    assert notifier.counts() == {'sent': 2, 'dead': 1}
+    assert [row['inquiry_id'] for row in notifier.dead_letters()] == [poison['id']]
 
-# Initialize CSRF protection
-csrf = CSRFProtect(app)
+    assert notifier.requeue_dead() == 1
+    assert tuple(outbox_row(notifier, poison))[:2] == ('pending', 0)
 
-@app.route('/')
+
+def test_refused_recipient_only_fails_its_own_row(notifier, relay):
+    relay.refused.add('ndt@example.com')
+    refused, accepted = inquiry(team='ndt'), inquiry()
+    notifier.enqueue([refused, accepted])
+
+    notifier._dispatch_batch()
+    assert outbox_row(notifier, accepted)['status'] == 'sent'
+    assert tuple(outbox_row(notifier, refused))[:2] == ('pending', 1)
+    assert notifier.deliveries['retry'] == 1
+
+
+def test_unreachable_relay_retries_the_whole_batch(notifier, relay):
+    relay.shutdown()
+    relay.server_close()
+    records = [inquiry(), inquiry()]
+    notifier.enqueue(records)
+
+    notifier._dispatch_batch()
+    for record in records:
+        status, attempts, error = outbox_row(notifier, record)
+        assert (status, attempts) == ('pending', 1)
+        assert error.startswith('connect:')
+"""Faceted spec search over the product catalog."""
+import math
+
+import pytest
+
+from catalog import catalog
+from spec_search import SpecIndex, parse_query, parse_range
+
+
+@pytest.fixture(scope='module')
 def index():
-    """Homepage with overview and key features"""
-    return render_template('index.html')
+    return SpecIndex(catalog)
 
-@app.route('/products')
-def products():
-    """Products catalog with detailed specifications"""
-    return render_template('products.html')
 
-@app.route('/services')
-def services():
-    """Services page with inquiry form"""
-    form = ServiceInquiryForm()
-    return render_template('services.html', form=form)
+def matching_slugs(index, filters):
+    mask = index.search(filters)
+    return {product.slug for product in index.rows(mask, len(index.products))}
 
-@app.route('/services', methods=['POST'])
-def services_post():
-    """Handle service inquiry form submission"""
-    form = ServiceInquiryForm()
-    
-    if form.validate_on_submit():
-        # Process the service inquiry
-        app.logger.info("🔧 New Service Inquiry Submission:")
-        app.logger.info(f"Company: {form.company.data}")
-        app.logger.info(f"Contact: {form.name.data}")
-        app.logger.info(f"Email: {form.email.data}")
-        app.logger.info(f"Phone: {form.phone.data}")
-        app.logger.info(f"Service Type: {form.service_type.data}")
-        app.logger.info(f"Project Details: {form.project_details.data}")
-        
-        flash('Thank you for your service inquiry! Our team will contact you within 24 hours.', 'success')
-        return redirect(url_for('services'))
-    
-    # If form validation fails, re-render with errors
-    return render_template('services.html', form=form)
 
-@app.route('/about')
-def about():
-    """About us page with company information and team"""
-    return render_template('about.html')
+def test_parse_range():
+    assert parse_range('50kN to 5000kN') == (50e3, 5000e3, 'force')
+    assert parse_range('0.01 to 50 Hz') == (0.01, 50.0, 'frequency')
+    assert parse_range('Up to 10 kHz') == (0.0, 10e3, 'frequency')
+    assert parse_range('640 x 480') is None
 
-@app.route('/contact')
-def contact():
-    """Contact page with contact form"""
-    form = ContactForm()
-    return render_template('contact.html', form=form)
 
-@app.route('/contact', methods=['POST'])
-def contact_post():
-    """Handle contact form submission"""
-    form = ContactForm()
-    
-    if form.validate_on_submit():
-        # Process the contact form
-        app.logger.info("📨 New Contact Form Submission:")
-        app.logger.info(f"Name: {form.name.data}")
-        app.logger.info(f"Email: {form.email.data}")
-        app.logger.info(f"Subject: {form.subject.data}")
-        app.logger.info(f"Message: {form.message.data}")
-        
-        flash('Thank you for contacting us! We will respond to your message shortly.', 'success')
-        return redirect(url_for('contact'))
-    
-    # If form validation fails, re-render with errors
-    return render_template('contact.html', form=form)
+def test_parse_query():
+    assert parse_query('>=1000kN') == (1e6, math.inf, 'force')
+    assert parse_query('1kN..5kN') == (1e3, 5e3, 'force')
+    with pytest.raises(ValueError):
+        parse_query('1kN..5Hz')
 
-@app.errorhandler(404)
-def not_found_error(error):
-    """Handle 404 errors"""
-    return render_template('base.html', error_message="Page not found"), 404
 
-@app.errorhandler(500)
-def internal_error(error):
-    """Handle 500 errors"""
-    return render_template('base.html', error_message="Internal server error"), 500
+def test_spec_label_facets_only_match_that_spec(index):
+    # 'frequency' and 'force' are spec labels as well as dimension names
+    assert 'digital-strain-gauge-systems' not in matching_slugs(index, {'frequency': '2000Hz'})
+    assert 'plate-load-test-systems' not in matching_slugs(index, {'force': '1kN..5kN'})
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
-from app import app
-from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, EmailField, TelField
-from wtforms.validators import DataRequired, Email, Length, Optional
 
-class ContactForm(FlaskForm):
-    """Contact form with validation"""
-    name = StringField('Full Name', validators=[
-        DataRequired(message='Please enter your full name'),
-        Length(min=2, max=100, message='Name must be between 2 and 100 characters')
-    ])
-    
-    email = EmailField('Email Address', validators=[
-        DataRequired(message='Please enter your email address'),
-        Email(message='Please enter a valid email address')
-    ])
-    
-    subject = StringField('Subject', validators=[
-        DataRequired(message='Please enter a subject'),
-        Length(min=5, max=200, message='Subject must be between 5 and 200 characters')
-    ])
-    
-    message = TextAreaField('Message', validators=[
-        DataRequired(message='Please enter your message'),
-        Length(min=10, max=2000, message='Message must be between 10 and 2000 characters')
-    ])
+def test_dimension_facets_match_any_spec_in_the_dimension(index):
+    assert 'digital-strain-gauge-systems' in matching_slugs(index, {'dim:frequency': '2000Hz'})
+    assert 'plate-load-test-systems' in matching_slugs(index, {'dim:force': '1kN..5kN'})
 
-class ServiceInquiryForm(FlaskForm):
-    """Service inquiry form for custom quotes"""
-    company = StringField('Company Name', validators=[
-        DataRequired(message='Please enter your company name'),
-        Length(min=2, max=150, message='Company name must be between 2 and 150 characters')
-    ])
-    
-    name = StringField('Contact Person', validators=[
-        DataRequired(message='Please enter the contact person name'),
-        Length(min=2, max=100, message='Name must be between 2 and 100 characters')
-    ])
-    
-    email = EmailField('Email Address', validators=[
-        DataRequired(message='Please enter your email address'),
-        Email(message='Please enter a valid email address')
-    ])
-    
-    phone = TelField('Phone Number', validators=[
-        Optional(),
-        Length(min=10, max=20, message='Phone number must be between 10 and 20 characters')
-    ])
-    
-    service_type = SelectField('Service Type', choices=[
-        ('', 'Select a service type...'),
-        ('structural_testing', 'Structural Load & Response Testing'),
-        ('ndt_inspection', 'Non-Destructive Testing & Inspection'),
-        ('geotechnical_testing', 'Geotechnical & Foundation Testing'),
-        ('custom_solution', 'Custom Testing Solution'),
-        ('equipment_rental', 'Equipment Rental'),
-        ('training_certification', 'Training & Certification'),
-        ('consultation', 'Engineering Consultation')
-    ], validators=[
-        DataRequired(message='Please select a service type')
-    ])
-    
-    project_details = TextAreaField('Project Details', validators=[
-        DataRequired(message='Please provide project details'),
-        Length(min=20, max=3000, message='Project details must be between 20 and 3000 characters')
-    ])
+
+def test_unknown_facet_and_wrong_unit(index):
+    with pytest.raises(KeyError):
+        index.search({'colour': '5kN'})
+    with pytest.raises(ValueError):
+        index.search({'dim:force': '5Hz'})
+{% if partial_navigation %}
+<div data-partial-content>
+    <title>{{ self.title() }}</title>
+    <meta name="description" content="{{ self.meta_description() }}">
+    {{ self.flash_messages() }}
+    <main>{{ self.main() }}</main>
+</div>
+{% else %}
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -166,15 +4737,23 @@ class ServiceInquiryForm(FlaskForm):
     <meta name="description" content="{% block meta_description %}Civil Structure Test Tech provides innovative testing tools for civil structures—built for precision, safety, and North America's B2B sector.{% endblock %}">
     <title>{% block title %}Civil Structure Test Tech{% endblock %}</title>
     
+    {% if config.VENDOR_ASSETS == 'local' %}
+    <!-- Critical layout CSS; trimmed Bootstrap and Font Awesome load without blocking render -->
+    <style>{{ vendor_critical_css }}</style>
+    <link rel="preload" href="{{ url_for('static', filename='vendor/vendor.css') }}" as="style" onload="this.onload=null;this.rel='stylesheet'">
+    <noscript><link rel="stylesheet" href="{{ url_for('static', filename='vendor/vendor.css') }}"></noscript>
+    {% else %}
     <!-- Bootstrap 5 CSS -->
     <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
     <!-- Font Awesome Icons -->
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
+    {% endif %}
     <!-- Custom CSS -->
     <link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}">
 </head>
 <body>
     <!-- Navigation -->
+    {% cache 'navbar', request.endpoint %}
     <nav class="navbar navbar-expand-lg navbar-dark fixed-top">
         <div class="container">
             <a class="navbar-brand fw-bold" href="{{ url_for('index') }}">
@@ -193,7 +4772,7 @@ class ServiceInquiryForm(FlaskForm):
                         </a>
                     </li>
                     <li class="nav-item">
-                        <a class="nav-link {% if request.endpoint == 'products' %}active{% endif %}" href="{{ url_for('products') }}">
+                        <a class="nav-link {% if request.endpoint in ('products', 'product_category', 'product_detail') %}active{% endif %}" href="{{ url_for('products') }}">
                             <i class="fas fa-cogs me-1"></i>Products
                         </a>
                     </li>
@@ -216,9 +4795,12 @@ class ServiceInquiryForm(FlaskForm):
             </div>
         </div>
     </nav>
+    {% endcache %}
+    {{ stream_flush() }}
 
     <!-- Flash Messages -->
-    {% with messages = get_flashed_messages(with_categories=true) %}
+    {% block flash_messages %}
+    {% with messages = get_flashed_messages(with_categories=true) if flashes_pending() else [] %}
         {% if messages %}
             <div class="flash-messages">
                 {% for category, message in messages %}
@@ -231,9 +4813,11 @@ class ServiceInquiryForm(FlaskForm):
             </div>
         {% endif %}
     {% endwith %}
+    {% endblock %}
 
     <!-- Main Content -->
     <main>
+        {% block main %}
         {% if error_message %}
             <div class="container mt-5 pt-5">
                 <div class="row justify-content-center">
@@ -247,9 +4831,11 @@ class ServiceInquiryForm(FlaskForm):
         {% else %}
             {% block content %}{% endblock %}
         {% endif %}
+        {% endblock %}
     </main>
 
     <!-- Footer -->
+    {% cache 'footer' %}
     <footer class="footer mt-5">
         <div class="container">
             <div class="row">
@@ -281,13 +4867,19 @@ class ServiceInquiryForm(FlaskForm):
             </div>
         </div>
     </footer>
+    {% endcache %}
 
     <!-- Bootstrap 5 JS -->
+    {% if config.VENDOR_ASSETS == 'local' %}
+    <script src="{{ url_for('static', filename='vendor/bootstrap.bundle.min.js') }}"></script>
+    {% else %}
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js"></script>
+    {% endif %}
     <!-- Custom JS -->
     <script src="{{ url_for('static', filename='js/main.js') }}"></script>
 </body>
 </html>
+{% endif %}
 {% extends "base.html" %}
 
 {% block title %}Advanced Testing Equipment for Safer Civil Structures - Civil Structure Test Tech{% endblock %}
@@ -470,6 +5062,7 @@ class ServiceInquiryForm(FlaskForm):
 </section>
 {% endblock %}
 {% extends "base.html" %}
+{% from "_catalog.html" import category_section, quote_cta %}
 
 {% block title %}Products - Testing Equipment Catalog - Civil Structure Test Tech{% endblock %}
 
@@ -479,230 +5072,16 @@ class ServiceInquiryForm(FlaskForm):
         <div class="row">
             <div class="col text-center mb-5">
                 <h1 class="display-4 fw-bold text-primary">Product Catalog</h1>
-                <p class="lead text-muted">Comprehensive testing equipment for all your civil engineering needs</p>
-            </div>
-        </div>
-
-        <!-- Structural Load & Response Testing -->
-        <section id="structural" class="mb-5">
-            <div class="row">
-                <div class="col">
-                    <h2 class="fw-bold text-primary mb-4">
-                        <i class="fas fa-weight-hanging me-3"></i>Structural Load & Response Testing
-                    </h2>
-                </div>
-            </div>
-            <div class="row">
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Hydraulic Load Frames</h5>
-                            <p class="card-text text-muted">High-capacity testing frames for static and dynamic load applications.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Capacity: 50kN to 5000kN</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Precision: ±0.5% of reading</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Control: Digital servo-hydraulic</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Data: Real-time acquisition</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Actuator Systems</h5>
-                            <p class="card-text text-muted">Precision actuators for multi-axis testing and complex loading scenarios.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Force: Up to 2500kN</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Stroke: 100mm to 1000mm</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Frequency: 0.01 to 50 Hz</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Control: Multi-channel coordination</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Static Load Testing Rigs</h5>
-                            <p class="card-text text-muted">Customizable rigs for beam, column, and slab testing applications.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Configuration: Modular design</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Span: Up to 12 meters</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Loading: Point, distributed, cyclic</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Standards: ASTM, ISO, EN compliant</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Dynamic Shakers & Vibration Tables</h5>
-                            <p class="card-text text-muted">Seismic simulation and dynamic response testing equipment.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Force: 10N to 50kN</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Frequency: DC to 2000 Hz</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Acceleration: Up to 100g</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Control: Random, sine, shock</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </section>
-
-        <!-- NDT & Sensing Tools -->
-        <section id="ndt" class="mb-5">
-            <div class="row">
-                <div class="col">
-                    <h2 class="fw-bold text-primary mb-4">
-                        <i class="fas fa-search me-3"></i>Structural Sensing & NDT Tools
-                    </h2>
-                </div>
-            </div>
-            <div class="row">
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Digital Strain Gauge Systems</h5>
-                            <p class="card-text text-muted">High-precision strain measurement with wireless capabilities.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Resolution: 1 microstrain</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Channels: Up to 128 per unit</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Range: ±50,000 microstrain</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Sampling: Up to 10 kHz</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Ultrasonic Pulse Velocity Testers</h5>
-                            <p class="card-text text-muted">Non-destructive concrete quality assessment and defect detection.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Frequency: 54 kHz standard</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Resolution: 0.1 μs</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Range: 0.1 to 6553.5 μs</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Memory: 250 readings storage</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Ground Penetrating Radar</h5>
-                            <p class="card-text text-muted">Subsurface investigation and reinforcement detection systems.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Frequency: 100 MHz to 2.6 GHz</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Depth: Up to 3 meters in concrete</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Resolution: Sub-centimeter</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Display: Real-time imaging</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Infrared Thermography Cameras</h5>
-                            <p class="card-text text-muted">Thermal imaging for defect detection and energy audits.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Resolution: 640 x 480 pixels</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Temperature: -40°C to +1200°C</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Accuracy: ±2°C or ±2%</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Analysis: Advanced software suite</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </section>
-
-        <!-- Geotechnical & Foundation Testing -->
-        <section id="geotechnical" class="mb-5">
-            <div class="row">
-                <div class="col">
-                    <h2 class="fw-bold text-primary mb-4">
-                        <i class="fas fa-layer-group me-3"></i>Geotechnical & Foundation Testing
-                    </h2>
-                </div>
-            </div>
-            <div class="row">
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Plate Load Test Systems</h5>
-                            <p class="card-text text-muted">In-situ bearing capacity and settlement testing equipment.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Plate sizes: 300mm to 762mm</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Load capacity: Up to 5000kN</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Settlement: 0.01mm resolution</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Standards: ASTM D1196, IS 1888</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Piezocone Penetrometer Test</h5>
-                            <p class="card-text text-muted">Advanced CPT systems for soil characterization and profiling.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Capacity: 200kN push force</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Depth: Up to 100 meters</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Parameters: qc, fs, u, inclination</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Rate: 20mm/second standard</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Vane Shear Testers</h5>
-                            <p class="card-text text-muted">In-situ shear strength measurement for cohesive soils.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Vane sizes: 33mm to 130mm</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Torque: Up to 980 N·m</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Rotation: 6°/minute standard</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Display: Digital readout</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-lg-6 mb-4">
-                    <div class="card h-100">
-                        <div class="card-body">
-                            <h5 class="card-title">Pressuremeters</h5>
-                            <p class="card-text text-muted">Lateral pressure testing for deformation modulus determination.</p>
-                            <ul class="list-unstyled">
-                                <li><i class="fas fa-cog text-primary me-2"></i>Pressure: Up to 5 MPa</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Volume: 535 cm³ capacity</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Depth: Up to 50 meters</li>
-                                <li><i class="fas fa-cog text-primary me-2"></i>Control: Automatic pressure regulation</li>
-                            </ul>
-                        </div>
-                    </div>
-                </div>
+                <p class="lead text-muted">Comprehensive testing equipment for all your civil engineering needs</p>
             </div>
-        </section>
+        </div>
+
+        {% for category in catalog.categories %}
+        {{ category_section(category, catalog.in_category(category.slug)) }}
+        {% endfor %}
 
         <!-- Call to Action -->
-        <section class="bg-primary text-white rounded p-5 text-center">
-            <h3 class="fw-bold mb-3">Need Detailed Specifications or Custom Solutions?</h3>
-            <p class="lead mb-4">Our technical team can provide detailed specifications, pricing, and custom configuration options for any equipment.</p>
-            <div class="d-flex flex-wrap justify-content-center gap-3">
-                <a href="{{ url_for('services') }}" class="btn btn-light btn-lg">
-                    <i class="fas fa-clipboard-list me-2"></i>Request Quote
-                </a>
-                <a href="{{ url_for('contact') }}" class="btn btn-outline-light btn-lg">
-                    <i class="fas fa-phone me-2"></i>Speak with Expert
-                </a>
-            </div>
-        </section>
+        {{ quote_cta() }}
     </div>
 </section>
 {% endblock %}
@@ -826,8 +5205,9 @@ class ServiceInquiryForm(FlaskForm):
                         Tell us about your project requirements and our team will provide you with a detailed service proposal.
                     </p>
                     
-                    <form method="POST" action="{{ url_for('services_post') }}">
+                    <form method="POST" action="{{ url_for('services_post') }}" data-api="{{ url_for('services_api') }}" data-rules="{{ form_rules_url('service') }}">
                         {{ form.hidden_tag() }}
+                        {{ spam_trap() }}
                         
                         <div class="row">
                             <div class="col-md-6 mb-3">
@@ -1255,8 +5635,9 @@ class ServiceInquiryForm(FlaskForm):
                             and our team will get back to you promptly.
                         </p>
                         
-                        <form method="POST" action="{{ url_for('contact_post') }}">
+                        <form method="POST" action="{{ url_for('contact_post') }}" data-api="{{ url_for('contact_api') }}" data-rules="{{ form_rules_url('contact') }}">
                             {{ form.hidden_tag() }}
+                            {{ spam_trap() }}
                             
                             <div class="row">
                                 <div class="col-md-6 mb-3">
@@ -1398,6 +5779,194 @@ class ServiceInquiryForm(FlaskForm):
     </div>
 </section>
 {% endblock %}
+{% macro product_card(product) %}
+                <div class="col-lg-6 mb-4">
+                    <div class="card h-100">
+                        <div class="card-body">
+                            <h5 class="card-title"><a href="{{ url_for('product_detail', slug=product.slug) }}" class="text-reset text-decoration-none">{{ product.name }}</a></h5>
+                            <p class="card-text text-muted">{{ product.summary }}</p>
+                            <ul class="list-unstyled">
+                                {% for label, value in product.specs %}
+                                <li><i class="fas fa-cog text-primary me-2"></i>{{ label }}: {{ value }}</li>
+                                {% endfor %}
+                            </ul>
+                        </div>
+                    </div>
+                </div>
+{% endmacro %}
+
+{% macro category_section(category, products) %}
+        <section id="{{ category.slug }}" class="mb-5">
+            <div class="row">
+                <div class="col">
+                    <h2 class="fw-bold text-primary mb-4">
+                        <a href="{{ url_for('product_category', category=category.slug) }}" class="text-reset text-decoration-none"><i class="fas {{ category.icon }} me-3"></i>{{ category.title }}</a>
+                    </h2>
+                </div>
+            </div>
+            <div class="row">
+                {% for product in products %}
+                {{ product_card(product) }}
+                {% endfor %}
+            </div>
+        </section>
+{% endmacro %}
+
+{% macro quote_cta() %}
+        <section class="bg-primary text-white rounded p-5 text-center">
+            <h3 class="fw-bold mb-3">Need Detailed Specifications or Custom Solutions?</h3>
+            <p class="lead mb-4">Our technical team can provide detailed specifications, pricing, and custom configuration options for any equipment.</p>
+            <div class="d-flex flex-wrap justify-content-center gap-3">
+                <a href="{{ url_for('services') }}" class="btn btn-light btn-lg">
+                    <i class="fas fa-clipboard-list me-2"></i>Request Quote
+                </a>
+                <a href="{{ url_for('contact') }}" class="btn btn-outline-light btn-lg">
+                    <i class="fas fa-phone me-2"></i>Speak with Expert
+                </a>
+            </div>
+        </section>
+{% endmacro %}
+{% extends "base.html" %}
+{% from "_catalog.html" import category_section, quote_cta %}
+
+{% block title %}{{ category.title }} - Testing Equipment Catalog - Civil Structure Test Tech{% endblock %}
+
+{% block content %}
+<section class="pt-5 mt-4">
+    <div class="container">
+        <div class="row">
+            <div class="col mb-4">
+                <a href="{{ url_for('products') }}" class="text-decoration-none"><i class="fas fa-arrow-left me-2"></i>Full Product Catalog</a>
+            </div>
+        </div>
+
+        {{ category_section(category, products) }}
+
+        <!-- Call to Action -->
+        {{ quote_cta() }}
+    </div>
+</section>
+{% endblock %}
+{% extends "base.html" %}
+{% from "_catalog.html" import quote_cta %}
+
+{% block title %}{{ product.name }} - Testing Equipment Catalog - Civil Structure Test Tech{% endblock %}
+{% block meta_description %}{{ product.name }}: {{ product.summary }}{% endblock %}
+
+{% block content %}
+<section class="pt-5 mt-4">
+    <div class="container">
+        <div class="row">
+            <div class="col mb-4">
+                <a href="{{ url_for('product_category', category=category.slug) }}" class="text-decoration-none"><i class="fas fa-arrow-left me-2"></i>{{ category.title }}</a>
+            </div>
+        </div>
+
+        <div class="row mb-5">
+            <div class="col-lg-8">
+                <h1 class="display-5 fw-bold text-primary mb-3">
+                    <i class="fas {{ category.icon }} me-3"></i>{{ product.name }}
+                </h1>
+                <p class="lead text-muted mb-4">{{ product.summary }}</p>
+                <table class="table">
+                    <tbody>
+                        {% for label, value in product.specs %}
+                        <tr>
+                            <th scope="row" class="text-primary">{{ label }}</th>
+                            <td>{{ value }}</td>
+                        </tr>
+                        {% endfor %}
+                    </tbody>
+                </table>
+            </div>
+        </div>
+
+        <!-- Call to Action -->
+        {{ quote_cta() }}
+    </div>
+</section>
+{% endblock %}
+{% extends "base.html" %}
+
+{% block title %}Inquiries - Admin - Civil Structure Test Tech{% endblock %}
+
+{% block content %}
+<section class="pt-5 mt-4">
+    <div class="container">
+        <div class="row mb-4">
+            <div class="col">
+                <h1 class="display-6 fw-bold text-primary">Inquiries</h1>
+            </div>
+            <div class="col-auto align-self-center">
+                <a href="{{ export_url }}" class="btn btn-outline-primary"><i class="fas fa-download me-2"></i>Export CSV</a>
+            </div>
+        </div>
+
+        <form method="GET" action="{{ url_for('admin_inquiries') }}" class="row g-2 mb-4">
+            <div class="col-md-3">
+                <input type="search" name="q" value="{{ args.q }}" class="form-control" placeholder="Search messages">
+            </div>
+            <div class="col-md-2">
+                <select name="service_type" class="form-select">
+                    <option value="">All services</option>
+                    {% for value, label in service_types %}
+                    <option value="{{ value }}"{% if args.service_type == value %} selected{% endif %}>{{ label }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="col-md-2">
+                <input type="text" name="domain" value="{{ args.domain }}" class="form-control" placeholder="Email domain">
+            </div>
+            <div class="col-md-2">
+                <input type="date" name="since" value="{{ args.since }}" class="form-control" title="From">
+            </div>
+            <div class="col-md-2">
+                <input type="date" name="until" value="{{ args.until }}" class="form-control" title="Until">
+            </div>
+            <div class="col-md-1">
+                <button type="submit" class="btn btn-primary w-100">Filter</button>
+            </div>
+        </form>
+
+        <table class="table">
+            <thead>
+                <tr>
+                    <th scope="col">Received</th>
+                    <th scope="col">Team</th>
+                    <th scope="col">From</th>
+                    <th scope="col">Inquiry</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for record in records %}
+                {% set data = record.data %}
+                <tr>
+                    <td class="text-nowrap">{{ record.created_at | inquiry_time }}</td>
+                    <td>{{ record.team or '' }}</td>
+                    <td>
+                        {{ data.name }}{% if data.company %}, {{ data.company }}{% endif %}<br>
+                        <a href="mailto:{{ data.email }}">{{ data.email }}</a>
+                        {% if data.phone %}<br>{{ data.phone }}{% endif %}
+                    </td>
+                    <td>
+                        <strong>{{ data.subject or data.service_type or record.kind }}</strong>
+                        <p class="text-muted small mb-0">{{ data.message or data.project_details }}</p>
+                    </td>
+                </tr>
+                {% else %}
+                <tr>
+                    <td colspan="4" class="text-muted">No inquiries match these filters.</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+
+        {% if next_url %}
+        <a href="{{ next_url }}" class="btn btn-outline-primary">Older<i class="fas fa-arrow-right ms-2"></i></a>
+        {% endif %}
+    </div>
+</section>
+{% endblock %}
 /* Custom styles for Civil Structure Test Tech */
 
 :root {
@@ -1727,16 +6296,25 @@ body {
 
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize all components
-    initSmoothScrolling();
-    initFormValidation();
-    initLoadingStates();
-    initAnimations();
-    initTooltips();
+    initContent(document);
+    initPartialNavigation();
+    initPrefetching();
 });
 
+// Initialize the components inside root (the document, or content swapped in by navigation)
+function initContent(root) {
+    initSmoothScrolling(root);
+    initFormValidation(root);
+    initLoadingStates(root);
+    initAjaxForms(root);
+    initAnimations(root);
+    initTooltips(root);
+    observePrefetchLinks(root);
+}
+
 // Smooth scrolling for anchor links
-function initSmoothScrolling() {
-    const links = document.querySelectorAll('a[href^="#"]');
+function initSmoothScrolling(root) {
+    const links = root.querySelectorAll('a[href^="#"]');
     
     links.forEach(link => {
         link.addEventListener('click', function(e) {
@@ -1758,10 +6336,12 @@ function initSmoothScrolling() {
 }
 
 // Enhanced form validation and UX
-function initFormValidation() {
-    const forms = document.querySelectorAll('form');
+function initFormValidation(root) {
+    const forms = root.querySelectorAll('form');
     
     forms.forEach(form => {
+        loadFormRules(form);
+        
         // Real-time validation
         const inputs = form.querySelectorAll('input, textarea, select');
         
@@ -1794,59 +6374,77 @@ function initFormValidation() {
             
             if (isValid) {
                 showLoadingState(form);
+            } else {
+                // Keep the post (and the other submit handlers) from running
+                e.preventDefault();
+                e.stopImmediatePropagation();
+                form.querySelector('.is-invalid').focus();
             }
         });
     });
 }
 
+// Validation rules compiled from the server's form classes (data-rules)
+function loadFormRules(form) {
+    if (!form.dataset.rules) {
+        return;
+    }
+    
+    fetch(form.dataset.rules)
+        .then(response => response.json())
+        .then(rules => {
+            form.validationRules = rules;
+        })
+        .catch(() => {
+            // Without rules the server still validates the post
+        });
+}
+
 // Field validation function
 function validateField(field) {
-    const value = field.value.trim();
-    const isRequired = field.hasAttribute('required');
-    const fieldType = field.type;
-    let isValid = true;
+    const rules = field.form && field.form.validationRules && field.form.validationRules[field.name];
+    
+    // Fields without rules, or a form whose rules have not loaded, are left to the server
+    if (!rules) {
+        return true;
+    }
     
     // Remove previous validation state
     field.classList.remove('is-valid', 'is-invalid');
     
-    // Check if required field is empty
-    if (isRequired && value === '') {
-        showFieldError(field, 'This field is required');
+    const error = fieldError(field.value, rules);
+    if (error) {
+        showFieldError(field, error);
         return false;
     }
     
-    // Email validation
-    if (fieldType === 'email' && value !== '') {
-        const emailRegex = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
-        if (!emailRegex.test(value)) {
-            showFieldError(field, 'Please enter a valid email address');
-            return false;
-        }
+    if (field.value.trim() !== '') {
+        field.classList.add('is-valid');
     }
     
-    // Phone validation
-    if (fieldType === 'tel' && value !== '') {
-        const phoneRegex = /^[\+]?[1-9][\d]{0,15}$/;
-        if (!phoneRegex.test(value.replace(/[\s\-\(\)]/g, ''))) {
-            showFieldError(field, 'Please enter a valid phone number');
-            return false;
-        }
+    return true;
+}
+
+// First rule a value breaks, with the server's message, or null
+function fieldError(value, rules) {
+    if (value.trim() === '') {
+        return rules.optional ? null : (rules.required || null);
     }
     
-    // Text length validation
-    if (field.hasAttribute('minlength')) {
-        const minLength = parseInt(field.getAttribute('minlength'));
-        if (value.length < minLength) {
-            showFieldError(field, `Minimum ${minLength} characters required`);
-            return false;
-        }
+    if (rules.email && !/^[^\s@]+@[^\s@]+\.[^\s@]+$/.test(value.trim())) {
+        return rules.email;
     }
     
-    if (isValid && value !== '') {
-        field.classList.add('is-valid');
+    if (rules.length) {
+        const [min, max, message] = rules.length;
+        // Browsers submit line breaks as CRLF, which the server counts as two characters
+        const length = value.replace(/\r?\n/g, '\r\n').length;
+        if ((min !== -1 && length < min) || (max !== -1 && length > max)) {
+            return message;
+        }
     }
     
-    return isValid;
+    return null;
 }
 
 // Show field error
@@ -1865,8 +6463,8 @@ function showFieldError(field, message) {
 }
 
 // Loading states for forms
-function initLoadingStates() {
-    const forms = document.querySelectorAll('form');
+function initLoadingStates(root) {
+    const forms = root.querySelectorAll('form');
     
     forms.forEach(form => {
         form.addEventListener('submit', function() {
@@ -1878,24 +6476,111 @@ function initLoadingStates() {
 function showLoadingState(form) {
     const submitBtn = form.querySelector('button[type="submit"]');
     
-    if (submitBtn) {
+    if (submitBtn && !submitBtn.classList.contains('loading')) {
         submitBtn.classList.add('loading');
         submitBtn.disabled = true;
         
-        const originalText = submitBtn.innerHTML;
+        submitBtn.dataset.originalHtml = submitBtn.innerHTML;
         submitBtn.innerHTML = submitBtn.innerHTML.replace(/<i[^>]*><\/i>/, '<i class="fas fa-spinner fa-spin"></i>');
         
         // Reset after 30 seconds (safety fallback)
-        setTimeout(() => {
-            submitBtn.classList.remove('loading');
-            submitBtn.disabled = false;
-            submitBtn.innerHTML = originalText;
-        }, 30000);
+        setTimeout(() => resetLoadingState(form), 30000);
+    }
+}
+
+function resetLoadingState(form) {
+    const submitBtn = form.querySelector('button[type="submit"]');
+    
+    if (submitBtn && submitBtn.classList.contains('loading')) {
+        submitBtn.classList.remove('loading');
+        submitBtn.disabled = false;
+        submitBtn.innerHTML = submitBtn.dataset.originalHtml;
+    }
+}
+
+// Submit forms that have a JSON endpoint (data-api) without leaving the page
+function initAjaxForms(root) {
+    const forms = root.querySelectorAll('form[data-api]');
+    
+    forms.forEach(form => {
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            submitForm(form);
+        });
+    });
+}
+
+function submitForm(form) {
+    fetch(form.dataset.api, {
+        method: 'POST',
+        body: new URLSearchParams(new FormData(form)),
+        headers: { 'Accept': 'application/json' },
+        credentials: 'same-origin'
+    })
+        .then(response => response.json())
+        .then(result => showSubmitResult(form, result), () => {
+            // No usable JSON reply: fall back to a regular page post
+            form.submit();
+        });
+}
+
+function showSubmitResult(form, result) {
+    resetLoadingState(form);
+    
+    if (result.ok) {
+        form.reset();
+        form.querySelectorAll('.is-valid').forEach(field => field.classList.remove('is-valid'));
+        showAlert(result.message, 'success');
+        return;
+    }
+    
+    if (result.errors) {
+        Object.entries(result.errors).forEach(([name, message]) => {
+            const field = form.elements[name];
+            if (field) {
+                showFieldError(field, message);
+            } else {
+                showAlert(message, 'error');
+            }
+        });
+        const firstInvalid = form.querySelector('.is-invalid');
+        if (firstInvalid) {
+            firstInvalid.focus();
+        }
+        return;
+    }
+    
+    showAlert(result.message, 'error');
+}
+
+// Show a dismissible alert in the same place as the server's flash messages
+function showAlert(message, category) {
+    let container = document.querySelector('.flash-messages');
+    if (!container) {
+        container = document.createElement('div');
+        container.className = 'flash-messages';
+        document.querySelector('main').before(container);
     }
+    
+    const success = category === 'success';
+    const alert = document.createElement('div');
+    alert.className = `alert alert-${success ? 'success' : 'danger'} alert-dismissible fade show`;
+    alert.setAttribute('role', 'alert');
+    alert.innerHTML = `<i class="fas fa-${success ? 'check-circle' : 'exclamation-triangle'} me-2"></i>`;
+    alert.appendChild(document.createTextNode(message));
+    
+    const closeBtn = document.createElement('button');
+    closeBtn.type = 'button';
+    closeBtn.className = 'btn-close';
+    closeBtn.setAttribute('data-bs-dismiss', 'alert');
+    alert.appendChild(closeBtn);
+    
+    container.appendChild(alert);
+    autoDismissAlert(alert);
 }
 
 // Scroll-based animations
-function initAnimations() {
+function initAnimations(root) {
     const observerOptions = {
         threshold: 0.1,
         rootMargin: '0px 0px -50px 0px'
@@ -1911,37 +6596,293 @@ function initAnimations() {
     }, observerOptions);
     
     // Observe elements for animation
-    const animatedElements = document.querySelectorAll('.card, .hero, section');
+    const animatedElements = root.querySelectorAll('.card, .hero, section');
     animatedElements.forEach(el => observer.observe(el));
 }
 
 // Initialize tooltips
-function initTooltips() {
+function initTooltips(root) {
     // Initialize Bootstrap tooltips if available
     if (typeof bootstrap !== 'undefined') {
-        const tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'));
+        const tooltipTriggerList = [].slice.call(root.querySelectorAll('[data-bs-toggle="tooltip"]'));
         tooltipTriggerList.map(function (tooltipTriggerEl) {
             return new bootstrap.Tooltip(tooltipTriggerEl);
         });
     }
 }
 
+// In-place navigation: internal links fetch only the page content (X-Partial)
+// and swap it into <main>, keeping the navbar, footer and scripts
+function initPartialNavigation() {
+    history.replaceState({ partial: true }, '', location.href);
+    
+    document.addEventListener('click', function(e) {
+        const link = e.target.closest('a[href]');
+        if (link && isPartialLink(link, e)) {
+            e.preventDefault();
+            navigateTo(link.href, true);
+        }
+    });
+    
+    window.addEventListener('popstate', function(e) {
+        if (e.state && e.state.partial) {
+            navigateTo(location.href, false);
+        }
+    });
+}
+
+function isPartialLink(link, e) {
+    if (e.defaultPrevented || e.button !== 0 || e.metaKey || e.ctrlKey || e.shiftKey || e.altKey) {
+        return false;
+    }
+    return isSitePageLink(link);
+}
+
+function isSitePageLink(link) {
+    if ((link.target && link.target !== '_self') || link.hasAttribute('download') || link.origin !== location.origin) {
+        return false;
+    }
+    // Files, APIs and the admin pages are not site pages
+    if (/^\/(static|api|admin|forms|metrics)(\/|$)/.test(link.pathname)) {
+        return false;
+    }
+    // Anchors within the current page scroll as usual
+    return !(link.pathname === location.pathname && link.search === location.search && link.hash);
+}
+
+function fetchPartial(url, isPrefetch) {
+    const headers = { 'X-Partial': 'content' };
+    if (isPrefetch) {
+        headers['Purpose'] = 'prefetch';
+    }
+    return fetch(url, { headers: headers, credentials: 'same-origin' }).then(response => {
+        if (isPrefetch && !response.ok) {
+            throw new Error(`Prefetch declined (${response.status})`);
+        }
+        return response.text().then(html => ({ finalUrl: response.url, html: html }));
+    });
+}
+
+function navigateTo(url, push) {
+    const prefetchedPage = takePrefetched(url);
+    const page = prefetchedPage
+        ? prefetchedPage.then(result => result || fetchPartial(url, false))
+        : fetchPartial(url, false);
+    
+    page
+        .then(({ finalUrl, html }) => {
+            const doc = new DOMParser().parseFromString(html, 'text/html');
+            const content = doc.querySelector('[data-partial-content]');
+            if (!content) {
+                // Not a partial render: let the browser load it
+                location.assign(url);
+                return;
+            }
+            if (push) {
+                history.pushState({ partial: true }, '', finalUrl + new URL(url).hash);
+            }
+            swapContent(doc, content);
+        })
+        .catch(() => location.assign(url));
+}
+
+function swapContent(doc, content) {
+    document.title = doc.title;
+    const description = doc.querySelector('meta[name="description"]');
+    const currentDescription = document.querySelector('meta[name="description"]');
+    if (description && currentDescription) {
+        currentDescription.setAttribute('content', description.getAttribute('content'));
+    }
+    
+    const main = document.querySelector('main');
+    document.querySelectorAll('.flash-messages').forEach(el => el.remove());
+    const flashes = content.querySelector('.flash-messages');
+    if (flashes) {
+        main.before(flashes);
+        flashes.querySelectorAll('.alert:not(.alert-permanent)').forEach(autoDismissAlert);
+    }
+    main.replaceChildren(...content.querySelector('main').childNodes);
+    
+    updateActiveNavLink(location.pathname);
+    const openMenu = document.querySelector('.navbar-collapse.show');
+    if (openMenu && typeof bootstrap !== 'undefined') {
+        bootstrap.Collapse.getOrCreateInstance(openMenu).hide();
+    }
+    
+    const target = location.hash && document.getElementById(location.hash.slice(1));
+    if (target) {
+        target.scrollIntoView();
+    } else {
+        window.scrollTo(0, 0);
+    }
+    
+    initContent(main);
+}
+
+function updateActiveNavLink(path) {
+    document.querySelectorAll('.navbar .nav-link').forEach(link => {
+        const active = link.pathname === '/' ? path === '/' : path.startsWith(link.pathname);
+        link.classList.toggle('active', active);
+    });
+}
+
+// Prefetching: fetch the partial form of internal pages on hover, or when their
+// links scroll into view while the browser is idle, so navigation can swap at once
+const PREFETCH_TTL = 5 * 60 * 1000;
+const prefetchedPages = new Map();
+const prefetchStats = { used: 0, unused: 0 };
+let prefetchObserver = null;
+let hoverTimer = null;
+
+function prefetchMode() {
+    const connection = navigator.connection;
+    if (connection && (connection.saveData || /(^|-)2g$/.test(connection.effectiveType))) {
+        return 'off';
+    }
+    // Viewport prefetching only on fast connections; hover intent everywhere else
+    return connection && connection.effectiveType !== '4g' ? 'hover' : 'all';
+}
+
+function initPrefetching() {
+    if (prefetchMode() === 'off') {
+        return;
+    }
+    
+    document.addEventListener('mouseover', function(e) {
+        const link = e.target.closest('a[href]');
+        if (link && isPrefetchLink(link)) {
+            clearTimeout(hoverTimer);
+            hoverTimer = setTimeout(() => prefetchPage(link.href), 65);
+        }
+    });
+    document.addEventListener('mouseout', function() {
+        clearTimeout(hoverTimer);
+    });
+    document.addEventListener('touchstart', function(e) {
+        const link = e.target.closest('a[href]');
+        if (link && isPrefetchLink(link)) {
+            prefetchPage(link.href);
+        }
+    }, { passive: true });
+    
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'hidden') {
+            reportPrefetches();
+        }
+    });
+    
+    if ('IntersectionObserver' in window && prefetchMode() === 'all') {
+        prefetchObserver = new IntersectionObserver(function(entries) {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    prefetchObserver.unobserve(entry.target);
+                    whenIdle(() => prefetchPage(entry.target.href));
+                }
+            });
+        });
+        observePrefetchLinks(document);
+    }
+}
+
+function observePrefetchLinks(root) {
+    if (!prefetchObserver) {
+        return;
+    }
+    root.querySelectorAll('a[href]').forEach(link => {
+        if (isPrefetchLink(link)) {
+            prefetchObserver.observe(link);
+        }
+    });
+}
+
+function whenIdle(callback) {
+    if ('requestIdleCallback' in window) {
+        requestIdleCallback(callback, { timeout: 2000 });
+    } else {
+        setTimeout(callback, 200);
+    }
+}
+
+function isPrefetchLink(link) {
+    return isSitePageLink(link) && pageKey(link.href) !== pageKey(location.href);
+}
+
+function pageKey(url) {
+    return url.split('#')[0];
+}
+
+function prefetchPage(url) {
+    const key = pageKey(url);
+    const cached = prefetchedPages.get(key);
+    if (cached && Date.now() - cached.time < PREFETCH_TTL) {
+        return;
+    }
+    const entry = { time: Date.now(), ready: false };
+    entry.page = fetchPartial(key, true)
+        .then(result => {
+            entry.ready = true;
+            return result;
+        })
+        .catch(() => null);
+    prefetchedPages.set(key, entry);
+}
+
+function takePrefetched(url) {
+    const key = pageKey(url);
+    const entry = prefetchedPages.get(key);
+    if (!entry) {
+        return null;
+    }
+    prefetchedPages.delete(key);
+    if (Date.now() - entry.time >= PREFETCH_TTL) {
+        if (entry.ready) {
+            prefetchStats.unused++;
+        }
+        return null;
+    }
+    return entry.page.then(result => {
+        if (result) {
+            prefetchStats.used++;
+        }
+        return result;
+    });
+}
+
+// Tell the server how many prefetched pages were used, for the hit-rate metric
+function reportPrefetches() {
+    prefetchedPages.forEach(entry => {
+        if (entry.ready) {
+            prefetchStats.unused++;
+        }
+    });
+    prefetchedPages.clear();
+    
+    if ((prefetchStats.used || prefetchStats.unused) && navigator.sendBeacon) {
+        const report = new Blob([JSON.stringify(prefetchStats)], { type: 'application/json' });
+        navigator.sendBeacon('/api/prefetch-report', report);
+    }
+    prefetchStats.used = 0;
+    prefetchStats.unused = 0;
+}
+
 // Auto-dismiss alerts after 5 seconds
 function initAutoDismissAlerts() {
     const alerts = document.querySelectorAll('.alert:not(.alert-permanent)');
     
-    alerts.forEach(alert => {
-        setTimeout(() => {
-            if (alert && alert.parentNode) {
-                alert.style.opacity = '0';
-                alert.style.transform = 'translateY(-20px)';
-                
-                setTimeout(() => {
-                    alert.remove();
-                }, 300);
-            }
-        }, 5000);
-    });
+    alerts.forEach(autoDismissAlert);
+}
+
+function autoDismissAlert(alert) {
+    setTimeout(() => {
+        if (alert && alert.parentNode) {
+            alert.style.opacity = '0';
+            alert.style.transform = 'translateY(-20px)';
+            
+            setTimeout(() => {
+                alert.remove();
+            }, 300);
+        }
+    }, 5000);
 }
 
 // Call auto-dismiss on page load